@@ -1,117 +1,323 @@
+# MoodMend 测试数据生成工具
+# 按后端的实际表结构（执行后端的迁移）生成测试用户和日志，用于功能演示和负载、规模测试:
+# 测试账号 test@test.com / 123，另外生成 N 个用户、每个用户平均 M 条日志。
+# 每个用户有自己的情绪倾向、任务完成率和活跃时间段；日志的徽章和情绪转移与后端记录日志时的规则一致。
+# 日志用 executemany 分批写入，每批一个事务，同一事务中按这批日志累加计数器、每日统计和连续打卡；
+# 写入期间暂停日志的计数器触发器，新数据多于已有数据时先删除日志表的二级索引和触发器，写完后重建。
+# 启用分片（MOODMEND_DB_SHARDS）时用户写入主库，日志按用户写入所属分片。
+# 需要在后端服务停止时、在运行后端的目录中执行（数据库文件与后端相同）。
+# 运行: python init_test_data.py                                   （测试账号和29条日志）
+#       python init_test_data.py --users 100000 --logs 500 --days 365 --seed 1
+
+import argparse
+import logging
+import os
+import random
 import sqlite3
+import sys
+import time
 import uuid
-import datetime
-import random
+from datetime import datetime
+from itertools import accumulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'backend'))
+
+from moodmend_backend import (DB_NAME, DB_SHARDS, add_bulk_log_stats, apply_transition,  # noqa: E402
+                              build_suggestion, connect_db, data_db_paths, get_lexicon, hash_password,
+                              init_db, rebuild_streaks, shard_index)
+
+# 测试账号（与后端登录的演示账号一致）
+TEST_USER = ('1', 'test@test.com', '123', '測試用戶')
+# 生成用户的统一密码（只计算一次bcrypt哈希）
+DEFAULT_PASSWORD = 'password123'
+# 生成用户的email域名和可选时区
+USER_EMAIL_DOMAIN = 'example.com'
+USER_TIMEZONES = (None, 'Asia/Taipei', 'Asia/Shanghai', 'Asia/Tokyo', 'Europe/London', 'America/New_York')
+
+# 情绪的总体分布（每个用户在此基础上随机调整），下一条日志保持上一条情绪的概率
+EMOTION_WEIGHTS = {'neutral': 30, 'happy': 25, 'anxious': 20, 'sad': 15, 'angry': 10}
+MOOD_PERSISTENCE = 0.35
+# 一天中各小时记录日志的相对权重（早晨和晚上较多，深夜很少）
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 4, 8, 10, 8, 6, 5, 7, 6, 5, 5, 6, 7, 9, 11, 12, 11, 7, 3)
+HOUR_CUM_WEIGHTS = list(accumulate(HOUR_WEIGHTS))
+
+LOG_COLUMNS = ('log_id', 'user_id', 'email', 'time', 'ts', 'day', 'emotion', 'task', 'nft',
+               'completed', 'transition_from', 'transition_to')
+INSERT_LOG = f"INSERT INTO logs ({', '.join(LOG_COLUMNS)}) VALUES ({', '.join('?' * len(LOG_COLUMNS))})"
+
+# 预先计算每种 (上次情绪, 本次情绪, 是否完成) 对应的任务、徽章和转移，与后端 build_suggestion/apply_transition 一致
+def build_outcomes():
+    lexicon = get_lexicon()
+    emotions = list(EMOTION_WEIGHTS)
+    outcomes = {}
+    for current in emotions:
+        for prev in [None] + emotions:
+            for completed in (0, 1):
+                result = apply_transition(build_suggestion(current, lexicon), prev, bool(completed))
+                transition = result['transition'] or {}
+                outcomes[prev, current, completed] = (result['package']['daily_task'], result['nft'],
+                                                      transition.get('from'), transition.get('to'))
+    return outcomes
+
+# 本地时间的格式化缓存: 每15分钟一项（所有时区的UTC偏移都是15分钟的整数倍），
+# 避免对每条日志调用 datetime.fromtimestamp
+class LocalClock:
+    def __init__(self):
+        self.cache = {}
+
+    # 返回 (ISO格式的本地时间, 本地日期)，与后端 datetime.now().isoformat() 和 date().isoformat() 一致
+    def format(self, ts):
+        slot, rest = divmod(ts, 900)
+        entry = self.cache.get(slot)
+        if entry is None:
+            start = datetime.fromtimestamp(slot * 900)
+            entry = self.cache[slot] = (start.strftime('%Y-%m-%dT%H:'), start.minute, start.date().isoformat())
+        prefix, minute, day = entry
+        return f'{prefix}{minute + rest // 60:02d}:{rest % 60:02d}', day
+
+# 随机的日志ID，与后端 str(uuid.uuid4()) 格式相同（版本4、RFC 4122变体），
+# 由带种子的随机数生成，可以重现，也比构造UUID对象快
+UUID4_MASK = ~((0xf << 76) | (0x3 << 62))
+UUID4_BITS = (0x4 << 76) | (0x2 << 62)
+
+def random_uuid4(rng):
+    h = f'{rng.getrandbits(128) & UUID4_MASK | UUID4_BITS:032x}'
+    return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+# 生成一个用户的日志行（按时间升序）和最后一次情绪；log_id由id_rng生成
+def generate_user_logs(rng, id_rng, clock, outcomes, user_id, email, count, start_ts, end_ts, utc_offset):
+    emotions = list(EMOTION_WEIGHTS)
+    # 每个用户的情绪倾向和任务完成率不同
+    cum_weights = list(accumulate(w * rng.uniform(0.3, 1.7) for w in EMOTION_WEIGHTS.values()))
+    completion_rate = rng.betavariate(3, 2)
+
+    # 按本地时间的日期和小时生成，utc_offset为本地时区相对UTC的秒数
+    first_day = (start_ts + utc_offset) // 86400
+    days = max(1, (end_ts + utc_offset) // 86400 - first_day + 1)
+    stamps = []
+    for hour in rng.choices(range(24), cum_weights=HOUR_CUM_WEIGHTS, k=count):
+        ts = (first_day + int(rng.random() * days)) * 86400 + hour * 3600 + int(rng.random() * 3600) - utc_offset
+        stamps.append(min(max(ts, start_ts), end_ts))
+    stamps.sort()
+
+    rows = []
+    prev = None
+    for ts, emotion in zip(stamps, rng.choices(emotions, cum_weights=cum_weights, k=count)):
+        if prev is not None and rng.random() < MOOD_PERSISTENCE:
+            emotion = prev
+        completed = 1 if rng.random() < completion_rate else 0
+        task, nft, transition_from, transition_to = outcomes[prev, emotion, completed]
+        local_time, day = clock.format(ts)
+        rows.append((random_uuid4(id_rng), user_id, email, local_time, ts, day,
+                     emotion, task, nft, completed, transition_from, transition_to))
+        prev = emotion
+    return rows, prev
+
+# 写入用户表，已存在的email保留原有user_id；返回 ({email: user_id}, 写入前已存在的email)
+def insert_users(conn, users, password_hash, created_at):
+    existing = {}
+    emails = [user[1] for user in users]
+    for i in range(0, len(emails), 500):
+        chunk = emails[i:i + 500]
+        existing.update(conn.execute(
+            f"SELECT email, user_id FROM users WHERE email IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT OR IGNORE INTO users (user_id, email, password, user_name, created_at, timezone) VALUES (?, ?, ?, ?, ?, ?)',
+        [(user_id, email, password_hash, name, created_at, timezone) for user_id, email, name, timezone in users]
+    )
+    conn.execute('COMMIT')
+    return {**{email: user_id for user_id, email, _, _ in users}, **existing}, set(existing)
+
+# 一个数据库文件的批量写入: 按批提交，每批的计数器、每日统计和连续打卡与日志在同一事务中累加；
+# 写入期间暂停计数器触发器，必要时暂时删除二级索引和触发器
+class LogLoader:
+    def __init__(self, path, planned_rows, batch_rows):
+        self.batch_rows = batch_rows
+        self.pending = []
+        self.last_emotions = []
+        # 之前已存在的用户（可能已有日志），写完后按全部日志重新计算连续打卡
+        self.existing_emails = []
+        self.inserted = 0
+        self.conn = connect_db(path, isolation_level=None)
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.last_rowid = self.conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM logs').fetchone()[0]
+        # 新数据多于已有数据时，暂时删除日志表的二级索引和触发器（暂停的触发器仍要对每行判断条件），
+        # 写完后重建比逐行维护快；否则只暂停计数器触发器
+        self.dropped = []
+        if planned_rows > self.last_rowid:
+            self.dropped = self.conn.execute('''
+                SELECT type, name, sql FROM sqlite_master
+                WHERE type IN ('index', 'trigger') AND tbl_name = 'logs' AND sql IS NOT NULL
+            ''').fetchall()
+        self.conn.execute('BEGIN IMMEDIATE')
+        for kind, name, _ in self.dropped:
+            self.conn.execute(f'DROP {kind.upper()} {name}')
+        self.conn.execute('INSERT INTO log_triggers_paused (paused) VALUES (1)')
+        self.conn.execute('COMMIT')
+
+    # 一个用户的全部新日志总是在同一批中写入；existing_email为之前已存在的用户
+    def add(self, rows, last_emotion, existing_email=None):
+        self.pending.extend(rows)
+        if last_emotion:
+            self.last_emotions.append(last_emotion)
+        if existing_email:
+            self.existing_emails.append(existing_email)
+        if len(self.pending) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending and not self.last_emotions:
+            return
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.executemany(INSERT_LOG, self.pending)
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO user_emotions (user_id, last_emotion, last_update) VALUES (?, ?, ?)',
+                self.last_emotions)
+            last_rowid = self.conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM logs').fetchone()[0]
+            if self.pending:
+                add_bulk_log_stats(self.conn.cursor(), self.last_rowid + 1, last_rowid)
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.last_rowid = last_rowid
+        self.inserted += len(self.pending)
+        self.pending = []
+        self.last_emotions = []
+
+    # 写入剩余的日志；无论写入是否成功，都重建删除的索引和触发器、取消暂停，
+    # 之前已有日志的用户重新计算连续打卡
+    def finish(self, completed=True):
+        try:
+            if completed:
+                self.flush()
+        finally:
+            try:
+                self._restore()
+            finally:
+                self.conn.close()
+
+    def _restore(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for _, _, sql in self.dropped:
+                self.conn.execute(sql)
+            self.conn.execute('DELETE FROM log_triggers_paused')
+            rebuild_streaks(self.conn.cursor(), self.existing_emails)
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+def generate(users, logs_per_user, days, seed, batch_rows):
+    rng = random.Random(seed)
+    clock = LocalClock()
+    outcomes = build_outcomes()
+    end_ts = int(time.time())
+    start_ts = end_ts - days * 86400
+    utc_offset = int(datetime.now().astimezone().utcoffset().total_seconds())
+    created_at = datetime.fromtimestamp(start_ts).isoformat()
+
+    # 测试账号使用演示密码，其他用户共用一个密码哈希
+    test_id, test_email, test_password, test_name = TEST_USER
+    main_conn = connect_db(DB_NAME, isolation_level=None)
+    try:
+        _, existed = insert_users(main_conn, [(test_id, test_email, test_name, None)],
+                                  hash_password(test_password), created_at)
+        # 测试账号的令牌固定为user_id '1'，日志也记在该user_id下
+        accounts = [(test_id, test_email, logs_per_user, bool(existed))]
+        if users:
+            password_hash = hash_password(DEFAULT_PASSWORD)
+            for i in range(0, users, batch_rows):
+                chunk = []
+                for n in range(i + 1, min(users, i + batch_rows) + 1):
+                    email = f'user{n:07d}@{USER_EMAIL_DOMAIN}'
+                    chunk.append((str(uuid.uuid5(uuid.NAMESPACE_DNS, email)), email, f'用戶{n}',
+                                  rng.choice(USER_TIMEZONES)))
+                user_ids, existed = insert_users(main_conn, chunk, password_hash, created_at)
+                # 每个用户的日志数在平均值上下浮动
+                accounts += [(user_ids[email], email, rng.randint(logs_per_user // 2, logs_per_user * 3 // 2),
+                              email in existed) for _, email, _, _ in chunk]
+    finally:
+        main_conn.close()
+
+    paths = data_db_paths()
+    planned = [0] * len(paths)
+    for user_id, _, count, _ in accounts:
+        planned[shard_index(user_id) if DB_SHARDS else 0] += count
+
+    loaders = []
+    try:
+        for path, rows in zip(paths, planned):
+            loaders.append(LogLoader(path, rows, batch_rows))
+        # log_id的随机数另外按种子和已有日志的状态生成: 同一种子在空数据库上可以重现，
+        # 在已有数据上再次运行（追加）时不会生成重复的log_id
+        existing = sum(loader.last_rowid for loader in loaders)
+        id_rng = random.Random(None if seed is None else f'{seed}:{existing}')
+        started = time.perf_counter()
+        total = 0
+        next_report = batch_rows * 10
+        for user_id, email, count, existed in accounts:
+            # 用户在时间范围内的某一天开始记录
+            user_start = start_ts + int(rng.random() ** 2 * days * 0.8) * 86400
+            rows, last_emotion = generate_user_logs(rng, id_rng, clock, outcomes, user_id, email, count,
+                                                    user_start, end_ts, utc_offset)
+            loader = loaders[shard_index(user_id) if DB_SHARDS else 0]
+            loader.add(rows, (user_id, last_emotion, rows[-1][3]) if rows else None, email if existed else None)
+            total += count
+            if total >= next_report:
+                elapsed = time.perf_counter() - started
+                print(f"已生成 {total} 条日志，{total / elapsed:,.0f} 条/秒")
+                next_report += batch_rows * 10
+        completed = True
+    except BaseException:
+        completed = False
+        raise
+    finally:
+        # 失败时也要恢复索引和触发器（已提交的批次已计入统计）；一个数据库恢复失败时仍继续恢复其他数据库
+        error = None
+        for loader in loaders:
+            try:
+                loader.finish(completed)
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+    return len(accounts), sum(loader.inserted for loader in loaders)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成MoodMend测试数据')
+    parser.add_argument('--users', type=int, default=0, help='测试账号以外另外生成的用户数（默认0）')
+    parser.add_argument('--logs', type=int, default=29, help='每个用户的平均日志数（默认29）')
+    parser.add_argument('--days', type=int, default=30, help='日志分布在最近多少天内（默认30）')
+    parser.add_argument('--seed', type=int, help='随机种子，指定后生成的数据可以重现')
+    parser.add_argument('--batch', type=int, default=100000, help='每个事务写入的日志行数（默认100000）')
+    args = parser.parse_args(argv)
+
+    if args.users < 0 or args.logs < 0 or args.days < 1 or args.batch < 1:
+        print('参数无效: 用户数和日志数不能为负数，天数和批大小至少为1')
+        return 2
+
+    # 生成期间不输出每次生成徽章的INFO日志
+    logging.getLogger('moodmend_backend').setLevel(logging.WARNING)
+    init_db()
+
+    started = time.perf_counter()
+    try:
+        accounts, inserted = generate(args.users, args.logs, args.days, args.seed, args.batch)
+    except sqlite3.Error as e:
+        print(f"生成测试数据失败: {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+    print(f"测试数据初始化完成！{accounts} 个用户，{inserted} 条日志，用时 {elapsed:.1f} 秒")
+    print("测试账号：")
+    print(f"邮箱: {TEST_USER[1]}")
+    print(f"密码: {TEST_USER[2]}")
+    if args.users:
+        print(f"其他用户: user0000001@{USER_EMAIL_DOMAIN} 等，密码: {DEFAULT_PASSWORD}")
+    return 0
 
-# 创建数据库连接
-db_path = 'moodmend.db'
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-# 创建users表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    email TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
-    user_name TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-# 创建logs表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS logs (
-    log_id TEXT PRIMARY KEY,
-    email TEXT NOT NULL,
-    time TIMESTAMP NOT NULL,
-    emotion TEXT NOT NULL,
-    task TEXT NOT NULL,
-    nft TEXT NOT NULL,
-    completed INTEGER DEFAULT 0,
-    FOREIGN KEY (email) REFERENCES users (email)
-)
-''')
-
-# 创建user_emotions表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS user_emotions (
-    user_id INTEGER,
-    email TEXT NOT NULL,
-    emotion TEXT NOT NULL,
-    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (email) REFERENCES users (email),
-    FOREIGN KEY (user_id) REFERENCES users (user_id)
-)
-''')
-
-# 插入测试用户
-cursor.execute('''
-INSERT OR IGNORE INTO users (email, password, user_name) 
-VALUES (?, ?, ?)
-''', ('test@test.com', '123', '测试用户'))
-
-# 准备情绪类型和对应的任务和NFT徽章
-emotions = {
-    'happy': {
-        'tasks': ['計劃一個小慶祝活動。', '分享你的喜悅給朋友。', '記錄今天的開心時刻。', '給自己一個小獎勵。', '做一件讓別人開心的事。'],
-        'nfts': ['⭐ 星光徽章 - 喜悅守護', '🌈 彩虹徽章 - 快樂使者', '☀️ 陽光徽章 - 正能量傳播者']
-    },
-    'sad': {
-        'tasks': ['與信任的朋友談談你的感受。', '出去走走，呼吸新鮮空氣。', '做一件讓自己放鬆的事。', '記下你的感受，釋放情緒。', '傾聽喜歡的音樂。'],
-        'nfts': ['🌧️ 雨滴徽章 - 情緒覺察者', '💧 水滴徽章 - 內心探索者', '🌦️ 風雨徽章 - 勇敢面對']
-    },
-    'angry': {
-        'tasks': ['深呼吸，冷靜一下。', '做一些放鬆的伸展運動。', '寫下讓你生氣的原因。', '暫時遠離刺激源。', '練習冥想，平靜心靈。'],
-        'nfts': ['⚡ 雷霆徽章 - 情緒管理師', '🔥 火焰徽章 - 能量轉化者', '🌪️ 旋風徽章 - 冷靜思考者']
-    },
-    'calm': {
-        'tasks': ['保持當下的平靜狀態。', '練習正念冥想。', '欣賞周圍的美好事物。', '記錄平靜帶給你的感受。', '與自然連接，感受寧靜。'],
-        'nfts': ['🌊 海洋徽章 - 內心平靜', '🍃 葉子徽章 - 隨遇而安', '🌙 月光徽章 - 寧靜守護者']
-    }
-}
-
-# 生成29条测试日志
-for i in range(29):
-    # 随机选择情绪
-    emotion_type = random.choice(list(emotions.keys()))
-    emotion_data = emotions[emotion_type]
-    
-    # 随机选择任务和NFT
-    task = random.choice(emotion_data['tasks'])
-    nft = random.choice(emotion_data['nfts'])
-    
-    # 生成随机完成状态
-    completed = random.randint(0, 1)
-    
-    # 生成过去30天内的随机时间
-    days_ago = random.randint(1, 30)
-    log_time = datetime.datetime.now() - datetime.timedelta(days=days_ago, hours=random.randint(0, 23), minutes=random.randint(0, 59))
-    
-    # 生成唯一的log_id
-    log_id = str(uuid.uuid4())
-    
-    # 插入日志
-    cursor.execute('''
-    INSERT OR IGNORE INTO logs (log_id, email, time, emotion, task, nft, completed)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (log_id, 'test@test.com', log_time.isoformat(), emotion_type, task, nft, completed))
-    
-    # 获取用户ID
-    cursor.execute('SELECT user_id FROM users WHERE email = ?', ('test@test.com',))
-    user_id = cursor.fetchone()[0]
-    
-    # 插入情绪记录
-    cursor.execute('''
-    INSERT INTO user_emotions (user_id, email, emotion)
-    VALUES (?, ?, ?)
-    ''', (user_id, 'test@test.com', emotion_type))
-
-# 提交事务并关闭连接
-conn.commit()
-conn.close()
-
-print("测试数据初始化完成！")
-print("测试账号：")
-print("邮箱: test@test.com")
-print("密码: 123")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
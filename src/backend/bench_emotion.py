@@ -0,0 +1,188 @@
+# MoodMend 情绪检测热点路径基准测试
+# 覆盖 detect_emotion、generate_nft_badge、generate_transition_nft，
+# 使用固定随机种子生成的语料（短文本、中等文本、多KB日记、中英混合、完全不命中），
+# 报告 ops/sec、p50/p99 延迟和每次调用的内存分配，并以 JSON 保存以便对比。
+# 运行: python bench_emotion.py [--output bench.json] [--compare baseline.json]
+
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from moodmend_backend import (detect_emotion, generate_nft_badge, generate_transition_nft,
+                              get_lexicon)
+
+# 填充文本用的常用字和英文单词（不含任何词库关键词）
+FILLER_CHARS = '今天我們一起去公司上班回家吃飯看書寫字走路天氣晴朗下雨朋友同事老師學校城市'
+FILLER_WORDS = ['meeting', 'coffee', 'today', 'work', 'home', 'lunch', 'project', 'weekend']
+EMOJIS = ['😀', '😢', '😡', '🙂', '☕', '🌧️']
+
+# 各语料的 (条数, 最小长度, 最大长度)
+CORPUS_SPECS = {
+    'short': (2000, 2, 20),
+    'medium': (1000, 100, 300),
+    'long': (100, 2000, 8000),
+    'mixed': (1000, 20, 200),
+    'no_match': (1000, 20, 300),
+}
+
+# 生成一条文本: 填充内容中按比例插入关键词
+def make_text(rng, keywords, length, keyword_ratio, mixed=False):
+    parts = []
+    size = 0
+    while size < length:
+        roll = rng.random()
+        if keywords and roll < keyword_ratio:
+            piece = rng.choice(keywords)
+        elif mixed and roll < 0.5:
+            piece = ' ' + rng.choice(FILLER_WORDS + EMOJIS) + ' '
+        else:
+            piece = ''.join(rng.choice(FILLER_CHARS) for _ in range(rng.randint(2, 8)))
+        parts.append(piece)
+        size += len(piece)
+    return ''.join(parts)[:length]
+
+def build_corpora(seed):
+    rng = random.Random(seed)
+    lexicon = get_lexicon()
+    keywords = [kw for keyword_list in lexicon.emotion_keywords.values() for kw, _ in keyword_list]
+    keywords += lexicon.negations + lexicon.neutral_phrases
+    corpora = {}
+    for name, (count, min_len, max_len) in CORPUS_SPECS.items():
+        texts = []
+        for _ in range(count):
+            length = rng.randint(min_len, max_len)
+            if name == 'no_match':
+                texts.append(make_text(rng, [], length, 0))
+            else:
+                texts.append(make_text(rng, keywords, length, 0.1, mixed=(name == 'mixed')))
+        corpora[name] = texts
+    return corpora
+
+# 计时: 逐次记录延迟，返回 ops/sec 和分位数
+def measure(func, args_list, repeat):
+    latencies = []
+    start = time.perf_counter_ns()
+    for _ in range(repeat):
+        for args in args_list:
+            t0 = time.perf_counter_ns()
+            func(*args)
+            latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter_ns() - start
+    latencies.sort()
+    n = len(latencies)
+    return {
+        'calls': n,
+        'ops_per_sec': round(n / (elapsed / 1e9), 1),
+        'p50_us': round(latencies[n // 2] / 1000, 2),
+        'p99_us': round(latencies[min(n - 1, int(n * 0.99))] / 1000, 2),
+        'mean_us': round(sum(latencies) / n / 1000, 2),
+    }
+
+# 内存分配: 用 tracemalloc 记录每次调用期间的峰值分配字节数和净增内存块数
+def measure_allocations(func, args_list):
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        blocks_total = 0
+        for args in args_list:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            blocks_before = sys.getallocatedblocks()
+            func(*args)
+            blocks_total += max(0, sys.getallocatedblocks() - blocks_before)
+            peak_total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    n = len(args_list) or 1
+    return {
+        'peak_alloc_bytes_per_call': round(peak_total / n, 1),
+        'net_blocks_per_call': round(blocks_total / n, 2),
+    }
+
+def run_benchmarks(seed, repeat, alloc_samples):
+    corpora = build_corpora(seed)
+    lexicon = get_lexicon()
+    emotions = list(lexicon.emotion_keywords)
+    pairs = [(a, b) for a in emotions for b in emotions]
+
+    cases = {}
+    for name, texts in corpora.items():
+        cases[f'detect_emotion/{name}'] = (detect_emotion, [(t,) for t in texts])
+    cases['generate_nft_badge/all'] = (generate_nft_badge, [(e,) for e in emotions] * 200)
+    cases['generate_transition_nft/all'] = (generate_transition_nft, pairs * 100)
+
+    results = {}
+    for case, (func, args_list) in cases.items():
+        # 预热
+        for args in args_list[:50]:
+            func(*args)
+        result = measure(func, args_list, repeat)
+        result.update(measure_allocations(func, args_list[:alloc_samples]))
+        results[case] = result
+        print(f"{case:<32} {result['ops_per_sec']:>12,.0f} ops/s  "
+              f"p50={result['p50_us']:>9.2f}us  p99={result['p99_us']:>9.2f}us  "
+              f"alloc={result['peak_alloc_bytes_per_call']:>9.1f}B")
+    return results
+
+# 与基线结果对比，返回变慢超过阈值的用例
+def compare(results, baseline, max_slowdown):
+    regressions = []
+    print(f"\n{'用例':<32} {'基线ops/s':>12} {'当前ops/s':>12} {'比值':>8}")
+    for case, result in results.items():
+        base = baseline.get('results', {}).get(case)
+        if not base:
+            continue
+        ratio = base['ops_per_sec'] / result['ops_per_sec'] if result['ops_per_sec'] else float('inf')
+        flag = '  <-- 变慢' if ratio > max_slowdown else ''
+        print(f"{case:<32} {base['ops_per_sec']:>12,.0f} {result['ops_per_sec']:>12,.0f} {ratio:>7.2f}x{flag}")
+        if ratio > max_slowdown:
+            regressions.append(case)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='情绪检测热点路径基准测试')
+    parser.add_argument('--output', default='bench_emotion.json', help='结果 JSON 文件')
+    parser.add_argument('--compare', help='与之对比的基线结果 JSON 文件')
+    parser.add_argument('--max-slowdown', type=float, default=1.5,
+                        help='相对基线变慢超过该倍数时返回非零退出码')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例重复遍历语料的次数')
+    parser.add_argument('--alloc-samples', type=int, default=200, help='统计内存分配的调用次数')
+    args = parser.parse_args(argv)
+
+    # 基准测试期间不输出每次生成徽章的INFO日志
+    logging.getLogger('moodmend_backend').setLevel(logging.WARNING)
+
+    results = run_benchmarks(args.seed, args.repeat, args.alloc_samples)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'lexicon_version': get_lexicon().version,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_slowdown)
+        if regressions:
+            print(f"性能回退: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# MoodMend 离线批量情绪重评分工具
+# 用 NumPy 对大量文本执行与 detect_emotion 相同的加权关键词评分：
+# 先构建 文本×关键词 的命中矩阵，再用矩阵乘法得到各情绪加权分数并取 argmax。
+# 运行: python bulk_rescore.py texts.txt [--keywords new_keywords.json] [--check-parity]
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+import numpy as np
+
+from moodmend_backend import MAX_EMOTION_SCAN_CHARS, detect_emotion, get_lexicon
+
+# 每批处理的文本数量上限，控制命中矩阵的内存占用
+DEFAULT_BATCH_SIZE = 200000
+# 每批的 条数×最长文本长度 上限: NumPy 定长字符串数组按最长文本为每条分配空间（每字符4字节），
+# 文本先按长度排序再分批，长文本不会让整批短文本占用同样的空间
+DEFAULT_BATCH_CHARS = 4 * 1024 * 1024
+
+# 词库编译: 去重后的小写关键词列表和 关键词×情绪 的权重矩阵
+class KeywordScorer:
+    def __init__(self, emotion_keywords):
+        self.emotions = list(emotion_keywords)
+        keyword_index = {}
+        rows = []
+        for col, (emotion, keyword_list) in enumerate(emotion_keywords.items()):
+            for kw, weight in keyword_list:
+                kw = kw.lower()
+                if kw not in keyword_index:
+                    keyword_index[kw] = len(rows)
+                    rows.append([0] * len(self.emotions))
+                # 同一关键词出现多次时权重累加，与 detect_emotion 一致
+                rows[keyword_index[kw]][col] += weight
+        self.keywords = list(keyword_index)
+        self.weights = np.array(rows, dtype=np.int64).reshape(len(self.keywords), len(self.emotions))
+        self.labels = np.array(self.emotions + ['neutral'], dtype=object)
+
+    # 对长度相近的一批文本评分，返回情绪标签数组
+    def _score_batch(self, texts):
+        arr = np.array(texts, dtype=str)
+        lowered = np.char.lower(arr)
+        # 命中矩阵: hits[i, k] 表示第 i 条文本是否包含第 k 个关键词
+        hits = np.empty((len(arr), len(self.keywords)), dtype=np.int64)
+        for k, kw in enumerate(self.keywords):
+            hits[:, k] = np.char.find(lowered, kw) >= 0
+        scores = hits @ self.weights
+        # argmax 返回第一个最大值，与 max(scores, key=scores.get) 的平手规则相同
+        best = scores.argmax(axis=1)
+        best_score = scores[np.arange(len(arr)), best]
+        best[best_score <= 0] = len(self.emotions)
+        return self.labels[best]
+
+    # 对文本评分，返回与输入顺序一致的情绪标签数组；与 detect_emotion 一样只扫描前 MAX_EMOTION_SCAN_CHARS 个字符。
+    # 按长度排序后分批，每批不超过 batch_size 条，且 条数×最长长度 不超过 batch_chars（单条超长时单独一批）
+    def score(self, texts, batch_size=DEFAULT_BATCH_SIZE, batch_chars=DEFAULT_BATCH_CHARS):
+        texts = [t[:MAX_EMOTION_SCAN_CHARS] if isinstance(t, str) else '' for t in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        labels = np.empty(len(texts), dtype=object)
+        start = 0
+        while start < len(order):
+            end = start + 1
+            while (end < len(order) and end - start < batch_size
+                   and (end - start + 1) * len(texts[order[end]]) <= batch_chars):
+                end += 1
+            batch = order[start:end]
+            labels[batch] = self._score_batch([texts[i] for i in batch])
+            start = end
+        return labels
+
+# 读取文本: 纯文本每行一条，或 JSONL 中指定字段
+def read_texts(path, field=None):
+    texts = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if field:
+                if not line.strip():
+                    continue
+                texts.append(json.loads(line).get(field) or '')
+            else:
+                texts.append(line)
+    return texts
+
+# 读取候选关键词权重: 完整的词库文件，或只有关键词的 {"anxious": [["焦慮", 2], ...], ...}
+def read_keywords(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    data = data.get('emotion_keywords', data)
+    return {emotion: [(kw, int(weight)) for kw, weight in keyword_list]
+            for emotion, keyword_list in data.items()}
+
+# 与逐条调用 detect_emotion 的结果对比，返回不一致的下标列表
+def check_parity(texts, labels):
+    return [i for i, (text, label) in enumerate(zip(texts, labels))
+            if detect_emotion(text) != label]
+
+def print_distribution(title, labels):
+    counts = Counter(labels.tolist())
+    total = len(labels) or 1
+    print(title)
+    for emotion, count in counts.most_common():
+        print(f"  {emotion:<8} {count:>10}  {count * 100 / total:6.2f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量重新评分历史情绪文本')
+    parser.add_argument('input', help='文本文件（每行一条）或 JSONL 文件')
+    parser.add_argument('--field', help='JSONL 中存放文本的字段名')
+    parser.add_argument('--keywords', help='候选词库文件或关键词权重 JSON，用于对比新旧分布')
+    parser.add_argument('--output', help='把每条文本的标签写入该文件（每行一个）')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每批最多条数')
+    parser.add_argument('--batch-chars', type=int, default=DEFAULT_BATCH_CHARS,
+                        help='每批 条数×最长文本长度 的上限，控制内存占用')
+    parser.add_argument('--check-parity', action='store_true',
+                        help='逐条调用 detect_emotion 校验结果是否一致')
+    args = parser.parse_args(argv)
+
+    texts = read_texts(args.input, args.field)
+    labels = KeywordScorer(get_lexicon().emotion_keywords).score(texts, args.batch_size, args.batch_chars)
+    print(f"共评分 {len(texts)} 条文本")
+    print_distribution('当前词库分布:', labels)
+
+    if args.keywords:
+        new_labels = KeywordScorer(read_keywords(args.keywords)).score(texts, args.batch_size, args.batch_chars)
+        print_distribution('候选词库分布:', new_labels)
+        changed = int((labels != new_labels).sum())
+        print(f"标签变化: {changed} 条 ({changed * 100 / (len(texts) or 1):.2f}%)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for label in labels:
+                f.write(f"{label}\n")
+
+    if args.check_parity:
+        mismatches = check_parity(texts, labels)
+        if mismatches:
+            for i in mismatches[:10]:
+                print(f"不一致: 第{i + 1}行 {texts[i][:30]!r} 批量={labels[i]} 逐条={detect_emotion(texts[i])}")
+            print(f"一致性校验失败: {len(mismatches)} 条不一致")
+            return 1
+        print('一致性校验通过')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+# MoodMend 后端服务 - ASGI 模式
+# 在 asyncio 事件循环上接收请求，交给有界线程池执行与 WSGI 模式完全相同的 Flask 处理函数，响应再由事件循环异步发送。
+# 请求体由事件循环逐块接收后放入有界缓冲区，处理线程从缓冲区读取（wsgi.input）:
+# 不超过一个缓冲区（默认64KB）的请求体在事件循环中收完后才交给处理线程，慢速上传的小请求不占用处理线程；
+# 更大的请求体（如 text/plain 长篇日记）边接收边由处理线程读取和扫描，不会缓存全文。
+# 并发上限: 处理函数和数据库访问（SQLite没有异步驱动）仍在处理线程中同步执行，同时处理的请求数
+# 不超过 MOODMEND_ASGI_THREADS，与 WSGI 模式的线程数上限相同；正在上传大请求体的连接也占用一个处理线程。
+# 事件循环只让等待排队的连接和小请求体的接收不占用线程。bcrypt 和情绪分类仍在各自的执行器中执行。
+# 运行: uvicorn moodmend_asgi:app --port 5000   （需要另外安装 uvicorn 等 ASGI 服务器）
+
+import asyncio
+import collections
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import moodmend_backend as backend
+
+# 执行Flask处理函数的线程数、请求体的最大字节数、请求体缓冲区的字节数
+ASGI_HANDLER_THREADS = int(os.environ.get('MOODMEND_ASGI_THREADS', 16))
+ASGI_MAX_BODY_BYTES = int(os.environ.get('MOODMEND_ASGI_MAX_BODY', 4 * 1024 * 1024))
+ASGI_BODY_BUFFER_BYTES = int(os.environ.get('MOODMEND_ASGI_BODY_BUFFER', 64 * 1024))
+
+logger = backend.logger
+
+# 请求体超过上限（处理线程读取时抛出，未被处理函数捕获时Flask返回413）
+class BodyTooLarge(RequestEntityTooLarge):
+    pass
+
+# 客户端在请求体发送完之前断开
+class ClientDisconnected(Exception):
+    pass
+
+# 请求体缓冲区（wsgi.input）: 事件循环放入收到的块，处理线程读取；
+# 缓冲的字节数达到上限时事件循环暂停接收，处理线程读走之后再继续
+class BodyStream(io.RawIOBase):
+    def __init__(self, loop, max_buffer):
+        self._loop = loop
+        self.max_buffer = max_buffer
+        self._chunks = collections.deque()
+        self._buffered = 0
+        self._eof = False
+        self._error = None
+        self._cond = threading.Condition()
+        # 缓冲区有空位 / 可以交给处理线程（已收完或缓冲区已满），只在事件循环中等待
+        self._space = asyncio.Event()
+        self._space.set()
+        self.ready = asyncio.Event()
+
+    def readable(self):
+        return True
+
+    # 事件循环: 放入一块请求体
+    def feed(self, data):
+        with self._cond:
+            if data:
+                self._chunks.append(data)
+                self._buffered += len(data)
+            if self._buffered >= self.max_buffer:
+                self._space.clear()
+                self.ready.set()
+            self._cond.notify_all()
+
+    # 事件循环: 请求体结束；error不为None时处理线程读取时抛出该异常
+    def feed_eof(self, error=None):
+        with self._cond:
+            self._eof = True
+            self._error = error
+            self._cond.notify_all()
+        self.ready.set()
+
+    async def wait_for_space(self):
+        await self._space.wait()
+
+    # 请求体结束时的错误（客户端断开、超过上限），没有时为None
+    @property
+    def error(self):
+        with self._cond:
+            return self._error
+
+    # 处理线程: 读取请求体，缓冲区为空时等待事件循环放入
+    def readinto(self, buffer):
+        with self._cond:
+            while not self._chunks and not self._eof:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            if not self._chunks:
+                return 0
+            chunk = self._chunks.popleft()
+            n = min(len(buffer), len(chunk))
+            buffer[:n] = chunk[:n]
+            if n < len(chunk):
+                self._chunks.appendleft(chunk[n:])
+            self._buffered -= n
+            if self._buffered < self.max_buffer:
+                self._loop.call_soon_threadsafe(self._space.set)
+            return n
+
+# 把ASGI的HTTP请求转换为WSGI environ，请求体从body_stream读取
+def build_environ(scope, body_stream):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body_stream,
+        # 请求体的结束由缓冲区标记，没有Content-Length（分块传输）时也能读取
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+# 在处理线程中执行WSGI应用，返回 (状态码, 响应头, 第一块响应体, 响应体迭代器, 原始结果)
+def start_wsgi(wsgi_app, environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return lambda data: None
+
+    result = wsgi_app(environ, start_response)
+    iterator = iter(result)
+    # 取出第一块，保证start_response已经被调用
+    first = next(iterator, b'')
+    return started['status'], started['headers'], first, iterator, result
+
+# 在处理线程中取下一块响应体，结束时返回None
+def next_chunk(iterator):
+    return next(iterator, None)
+
+def close_result(result):
+    if hasattr(result, 'close'):
+        result.close()
+
+class AsgiApp:
+    def __init__(self, wsgi_app, threads=None, max_body=None, buffer_bytes=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads or ASGI_HANDLER_THREADS
+        self.max_body = max_body or ASGI_MAX_BODY_BYTES
+        self.buffer_bytes = buffer_bytes or ASGI_BODY_BUFFER_BYTES
+        self._executor = None
+
+    # 首次使用时才创建处理线程池
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi-handler')
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"不支持的ASGI連接類型: {scope['type']}")
+
+    # 启动时初始化服务，关闭时写完写入队列并关闭执行器
+    async def _lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await loop.run_in_executor(self._get_executor(), backend.start_services)
+                    logger.info("MoodMend後端服務啟動 (ASGI)")
+                    await send({'type': 'lifespan.startup.complete'})
+                except Exception as e:
+                    logger.critical(f"服務啟動失敗: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+            elif message['type'] == 'lifespan.shutdown':
+                await loop.run_in_executor(self._get_executor(), backend.stop_services)
+                if self._executor is not None:
+                    self._executor.shutdown(wait=True)
+                    self._executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # 在事件循环中逐块接收请求体放入缓冲区，缓冲区满时等待处理线程读取；超过上限或客户端断开时结束请求体
+    async def _receive_body(self, receive, body_stream):
+        size = 0
+        while True:
+            await body_stream.wait_for_space()
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body_stream.feed_eof(ClientDisconnected())
+                return
+            body = message.get('body', b'')
+            size += len(body)
+            if size > self.max_body:
+                body_stream.feed_eof(BodyTooLarge())
+                return
+            body_stream.feed(body)
+            if not message.get('more_body', False):
+                body_stream.feed_eof()
+                return
+
+    async def _send_too_large(self, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': '{"success": false, "message": "請求內容過大"}'.encode('utf-8'),
+        })
+
+    async def _http(self, scope, receive, send):
+        content_length = next((v for k, v in scope.get('headers', []) if k.lower() == b'content-length'), None)
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body:
+            await self._send_too_large(send)
+            return
+
+        loop = asyncio.get_running_loop()
+        body_stream = BodyStream(loop, self.buffer_bytes)
+        receiving = asyncio.ensure_future(self._receive_body(receive, body_stream))
+        result = None
+        try:
+            # 小请求体收完（或缓冲区已满）后才占用处理线程
+            await body_stream.ready.wait()
+            if isinstance(body_stream.error, ClientDisconnected):
+                return
+            if isinstance(body_stream.error, BodyTooLarge):
+                await self._send_too_large(send)
+                return
+
+            executor = self._get_executor()
+            status, headers, first, iterator, result = await loop.run_in_executor(
+                executor, start_wsgi, self.wsgi_app, build_environ(scope, body_stream))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            chunk = first
+            # 流式响应逐块在处理线程中生成，由事件循环发送
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(executor, next_chunk, iterator)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # 处理函数没有读完的请求体不再接收
+            receiving.cancel()
+            if result is not None:
+                await loop.run_in_executor(self._get_executor(), close_result, result)
+
+app = AsgiApp(backend.app)
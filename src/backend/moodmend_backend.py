@@ -3,7 +3,7 @@
 # 版本: 4.0
 # 运行: python moodmend_backend.py
 
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import re
@@ -14,7 +14,21 @@ import uuid
 import bcrypt
 import sqlite3
 import threading
+import queue
+import time
+import hashlib
+import hmac
+import base64
+import codecs
+import csv
+import io
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 from functools import wraps
+from zoneinfo import ZoneInfo
 
 # 配置日志
 # 设置默认编码为UTF-8
@@ -55,6 +69,79 @@ CORS(app, origins='*', methods=['GET', 'POST', 'OPTIONS'], allow_headers=['*'])
 # 数据库配置
 DB_NAME = 'moodmend.db'
 
+# 分片存储: 大于0时按user_id的哈希把日志、统计、连续打卡和上次情绪分散到N个数据库文件，
+# 每个分片有独立的连接池和写线程，写入可以并行；用户表仍只在主库中。改变分片数后需运行 rebalance_shards.py
+DB_SHARDS = int(os.environ.get('MOODMEND_DB_SHARDS', 0))
+DB_SHARD_PATTERN = 'moodmend_shard_{:02d}.db'
+
+# 日志归档: 早于该天数的日志移入压缩的归档库（0表示不归档，最少31天，保证周/月统计只读热数据），
+# 每天执行一次；归档库与数据库同名加 _archive 后缀
+ARCHIVE_AFTER_DAYS = int(os.environ.get('MOODMEND_ARCHIVE_DAYS', 0))
+ARCHIVE_MIN_DAYS = 31
+ARCHIVE_INTERVAL = 24 * 3600
+
+# SQLite连接池: 连接数、等待空闲连接的超时(秒)、写锁忙等待(毫秒)、页缓存(KB)、内存映射(字节)
+DB_POOL_SIZE = int(os.environ.get('MOODMEND_DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('MOODMEND_DB_POOL_TIMEOUT', 5))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('MOODMEND_DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.environ.get('MOODMEND_DB_CACHE_KB', 16384))
+DB_MMAP_SIZE = int(os.environ.get('MOODMEND_DB_MMAP_SIZE', 256 * 1024 * 1024))
+
+# 写入队列（组提交）: 每批最多条数(0表示在请求线程内直接写入)、凑批的时间窗口(毫秒)、排队上限、等待提交的超时(秒)
+WRITE_BATCH_SIZE = int(os.environ.get('MOODMEND_WRITE_BATCH_SIZE', 64))
+WRITE_BATCH_WINDOW_MS = float(os.environ.get('MOODMEND_WRITE_BATCH_WINDOW_MS', 5))
+WRITE_MAX_QUEUE = int(os.environ.get('MOODMEND_WRITE_QUEUE', 1024))
+WRITE_TIMEOUT = float(os.environ.get('MOODMEND_WRITE_TIMEOUT', 5))
+
+# 情绪词库文件（带版本号，修改后自动热更新）及检查间隔(秒)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEXICON_PATH = os.environ.get('MOODMEND_LEXICON',
+                              os.path.join(BASE_DIR, '..', '..', 'config', 'emotion_lexicon.json'))
+LEXICON_POLL_INTERVAL = 2
+
+# 批量处理情绪时单次请求的最大条数
+MAX_BATCH_SIZE = 100
+
+# 导出日志: 每批从数据库读取的行数、每次发送给客户端的字节数
+EXPORT_BATCH_ROWS = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# 情绪检测缓存配置: 最大条目数、过期时间(秒)、可缓存的最大文本长度
+EMOTION_CACHE_SIZE = 4096
+EMOTION_CACHE_TTL = 600
+EMOTION_CACHE_MAX_TEXT = 64
+
+# 长文本情绪检测: 每次扫描的字符块大小、流式读取请求体的字节数、单次请求最多扫描的字符数
+EMOTION_SCAN_CHUNK = 4096
+STREAM_READ_BYTES = 16384
+MAX_EMOTION_SCAN_CHARS = int(os.environ.get('MOODMEND_MAX_SCAN_CHARS', 200000))
+# 流式请求体不超过该字符数时直接在请求线程中扫描，更长的交给情绪分类进程池
+STREAM_INLINE_CHARS = 4096
+
+# 情绪分类进程池: 进程数(0表示在请求线程内执行)、排队上限、单个任务超时(秒)
+CLASSIFY_WORKERS = int(os.environ.get('MOODMEND_CLASSIFY_WORKERS', 2))
+CLASSIFY_MAX_QUEUE = int(os.environ.get('MOODMEND_CLASSIFY_QUEUE', 32))
+CLASSIFY_TIMEOUT = float(os.environ.get('MOODMEND_CLASSIFY_TIMEOUT', 5))
+
+# 密码哈希执行器: 线程数、排队上限、单次哈希/校验的超时(秒)
+BCRYPT_WORKERS = int(os.environ.get('MOODMEND_BCRYPT_WORKERS', 2))
+BCRYPT_MAX_QUEUE = int(os.environ.get('MOODMEND_BCRYPT_QUEUE', 16))
+BCRYPT_TIMEOUT = float(os.environ.get('MOODMEND_BCRYPT_TIMEOUT', 10))
+
+# 执行器繁忙返回503时，建议客户端等待的秒数
+RETRY_AFTER_SECONDS = 1
+
+# 在线备份: 备份目录、每步复制的页数、每步之间的休眠(毫秒)、保留的备份任务记录数
+BACKUP_DIR = os.environ.get('MOODMEND_BACKUP_DIR', '.')
+BACKUP_PAGES_PER_STEP = int(os.environ.get('MOODMEND_BACKUP_PAGES', 1024))
+BACKUP_STEP_SLEEP_MS = float(os.environ.get('MOODMEND_BACKUP_SLEEP_MS', 5))
+BACKUP_MAX_JOBS = 20
+
+# 会话令牌: 签名密钥（未设置时使用数据库旁的密钥文件，首次使用时生成，重启和多个工作进程共用）和有效期(秒)
+TOKEN_SECRET = os.environ.get('MOODMEND_TOKEN_SECRET', '').encode('utf-8')
+TOKEN_SECRET_FILE = os.environ.get('MOODMEND_TOKEN_SECRET_FILE', 'moodmend_token.key')
+TOKEN_TTL = int(os.environ.get('MOODMEND_TOKEN_TTL', 7 * 24 * 3600))
+
 # 线程锁，用于并发安全
 db_lock = threading.RLock()
 
@@ -63,187 +150,916 @@ users_db = {}
 logs_db = []
 user_last_emotion = {}
 
-# 初始化数据库
+# 工具函数: 读取表的列名和类型，表不存在时返回空字典
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1]: (row[2] or '').upper() for row in cursor.fetchall()}
+
+# 迁移1: 基础表结构
+def _migrate_base_schema(cursor):
+    # 创建用户表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            user_name TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_login TEXT
+        )
+    ''')
+    # 创建日志表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS logs (
+            log_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            email TEXT,
+            time TEXT,
+            emotion TEXT,
+            task TEXT,
+            nft TEXT,
+            completed BOOLEAN,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    # 创建用户情绪表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_emotions (
+            user_id TEXT PRIMARY KEY,
+            last_emotion TEXT,
+            last_update TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+# 迁移2: 兼容旧数据库和 init_test_data.py 创建的表结构
+# （users.user_id为INTEGER且没有last_login、logs没有user_id、user_emotions是情绪历史表）
+def _migrate_reconcile_legacy(cursor):
+    # users: 缺少user_name时补列；user_id不是TEXT或缺少last_login时重建
+    columns = _table_columns(cursor, 'users')
+    if 'user_name' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN user_name TEXT NOT NULL DEFAULT '用户'")
+    if columns.get('user_id') != 'TEXT' or 'last_login' not in columns:
+        cursor.execute('''
+            CREATE TABLE users_new (
+                user_id TEXT PRIMARY KEY,
+                email TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                user_name TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                last_login TEXT
+            )
+        ''')
+        last_login = 'last_login' if 'last_login' in columns else 'NULL'
+        cursor.execute(f'''
+            INSERT INTO users_new (user_id, email, password, user_name, created_at, last_login)
+            SELECT CAST(user_id AS TEXT), email, password, COALESCE(user_name, '用户'), created_at, {last_login}
+            FROM users
+        ''')
+        cursor.execute('DROP TABLE users')
+        cursor.execute('ALTER TABLE users_new RENAME TO users')
+
+    # logs: 补user_id列，并按email回填
+    if 'user_id' not in _table_columns(cursor, 'logs'):
+        cursor.execute('ALTER TABLE logs ADD COLUMN user_id TEXT')
+    cursor.execute('''
+        UPDATE logs SET user_id = (SELECT u.user_id FROM users u WHERE u.email = logs.email)
+        WHERE user_id IS NULL
+    ''')
+
+    # user_emotions: 历史表改名保留，按记录时间取每个用户最后一次情绪写入新表
+    columns = _table_columns(cursor, 'user_emotions')
+    if 'last_emotion' not in columns:
+        cursor.execute('ALTER TABLE user_emotions RENAME TO user_emotions_legacy')
+        _migrate_base_schema(cursor)
+        cursor.execute('''
+            INSERT OR REPLACE INTO user_emotions (user_id, last_emotion, last_update)
+            SELECT u.user_id, ue.emotion, ue.recorded_at
+            FROM user_emotions_legacy ue
+            JOIN users u ON u.email = ue.email
+            ORDER BY ue.recorded_at, ue.rowid
+        ''')
+
+# 迁移3: 日志增加整数时间戳ts（epoch秒）和本地日期day，回填已有记录，并创建日志查询索引:
+# 日期和时间段过滤按索引范围扫描；日志列表按 (ts, time, log_id) 排序和游标定位（ts只精确到秒，同一秒内按微秒的time
+# 保持写入顺序，log_id保证顺序唯一），索引末尾加上time和log_id，翻页时直接按索引定位
+def _migrate_log_time_columns(cursor):
+    columns = _table_columns(cursor, 'logs')
+    if 'ts' not in columns:
+        cursor.execute('ALTER TABLE logs ADD COLUMN ts INTEGER')
+    if 'day' not in columns:
+        cursor.execute('ALTER TABLE logs ADD COLUMN day TEXT')
+    # time是本地时间的ISO字符串，'utc'修饰符按本地时区换算为epoch
+    cursor.execute("""
+        UPDATE logs SET ts = CAST(strftime('%s', time, 'utc') AS INTEGER), day = date(time)
+        WHERE ts IS NULL AND time IS NOT NULL
+    """)
+    # 没有写入ts的旧客户端（如测试数据脚本）插入后自动补齐
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_fill_ts AFTER INSERT ON logs
+        WHEN NEW.ts IS NULL AND NEW.time IS NOT NULL
+        BEGIN
+            UPDATE logs SET ts = CAST(strftime('%s', NEW.time, 'utc') AS INTEGER), day = date(NEW.time)
+            WHERE rowid = NEW.rowid;
+        END
+    """)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_user_ts ON logs (user_id, ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_email_ts_time ON logs (email, ts, time, log_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_email_day_ts_time ON logs (email, day, ts, time, log_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_email_emotion_ts_time ON logs (email, emotion, ts, time, log_id)')
+
+# 日志计数器的维度: 情绪（''表示全部）× 日期（''表示全部，以及年、年月、完整日期），
+# 每条日志对应最多8个计数器；row为 NEW 或 OLD，delta为 +1 或 -1
+def _log_counter_upsert(row, delta):
+    return f"""
+        INSERT INTO log_counters (email, emotion, period, count)
+        SELECT {row}.email, e.v, p.v, {delta}
+        FROM (SELECT '' AS v UNION ALL SELECT {row}.emotion) e,
+             (SELECT '' AS v
+              UNION ALL SELECT substr(COALESCE({row}.day, date({row}.time)), 1, 4)
+              UNION ALL SELECT substr(COALESCE({row}.day, date({row}.time)), 1, 7)
+              UNION ALL SELECT COALESCE({row}.day, date({row}.time))) p
+        WHERE {row}.email IS NOT NULL AND e.v IS NOT NULL AND p.v IS NOT NULL
+        ON CONFLICT (email, emotion, period) DO UPDATE SET count = count + ({delta});
+    """
+
+# 迁移4: 按用户、按过滤条件的日志计数器，由触发器在插入/删除/修改日志时同步更新，
+# 查询日志总数时直接读取计数器，不再执行COUNT(*)
+def _migrate_log_counters(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS log_counters (
+            email TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            period TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (email, emotion, period)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute('DELETE FROM log_counters')
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_counters_insert AFTER INSERT ON logs
+        BEGIN {_log_counter_upsert('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_counters_delete AFTER DELETE ON logs
+        BEGIN {_log_counter_upsert('OLD', -1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_counters_update AFTER UPDATE OF email, emotion, time, day ON logs
+        BEGIN {_log_counter_upsert('OLD', -1)} {_log_counter_upsert('NEW', 1)} END
+    """)
+    # 回填已有日志
+    cursor.execute("""
+        WITH keyed AS (
+            SELECT email, emotion, COALESCE(day, date(time)) AS d FROM logs WHERE email IS NOT NULL
+        ), expanded AS (
+            SELECT email,
+                   CASE e.k WHEN 0 THEN '' ELSE emotion END AS emotion,
+                   CASE p.k WHEN 0 THEN '' WHEN 1 THEN substr(d, 1, 4)
+                            WHEN 2 THEN substr(d, 1, 7) ELSE d END AS period
+            FROM keyed,
+                 (SELECT 0 AS k UNION ALL SELECT 1) e,
+                 (SELECT 0 AS k UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3) p
+        )
+        INSERT INTO log_counters (email, emotion, period, count)
+        SELECT email, emotion, period, COUNT(*) FROM expanded
+        WHERE emotion IS NOT NULL AND period IS NOT NULL
+        GROUP BY email, emotion, period
+    """)
+
+# 日汇总表中按情绪计数的列（与统计图表的情绪一致）
+STATS_EMOTIONS = ('anxious', 'sad', 'neutral', 'happy', 'angry')
+DAILY_STATS_COLUMNS = ('total', 'completed', 'transitions') + STATS_EMOTIONS
+
+# 判断一条日志是否为情绪转移: 迁移5使用徽章文字匹配，迁移7起使用结构化的transition_to列
+LEGACY_TRANSITION_TERM = "{row}.nft LIKE '%成功緩和%'"
+TRANSITION_TERM = "{row}.transition_to IS NOT NULL"
+
+# 一条日志对日汇总各列的贡献，row为 NEW、OLD 或 logs
+def _daily_stats_terms(row, transition=TRANSITION_TERM):
+    terms = [
+        '1',
+        f"CASE WHEN {row}.completed = 1 THEN 1 ELSE 0 END",
+        f"CASE WHEN {transition.format(row=row)} THEN 1 ELSE 0 END",
+    ]
+    terms += [f"CASE WHEN {row}.emotion = '{emotion}' THEN 1 ELSE 0 END" for emotion in STATS_EMOTIONS]
+    return terms
+
+def _daily_stats_upsert(row, delta, transition=TRANSITION_TERM):
+    columns = ', '.join(DAILY_STATS_COLUMNS)
+    values = ', '.join(f"{delta} * ({term})" for term in _daily_stats_terms(row, transition))
+    updates = ', '.join(f"{col} = {col} + excluded.{col}" for col in DAILY_STATS_COLUMNS)
+    return f"""
+        INSERT INTO daily_user_stats (email, day, {columns})
+        SELECT {row}.email, COALESCE({row}.day, date({row}.time), ''), {values}
+        WHERE {row}.email IS NOT NULL
+        ON CONFLICT (email, day) DO UPDATE SET {updates};
+    """
+
+# 用户全部日志的统计汇总（每个用户一行），period=all 时直接读取
+def _stats_totals_upsert(row, delta):
+    columns = ', '.join(DAILY_STATS_COLUMNS)
+    values = ', '.join(f"{delta} * ({term})" for term in _daily_stats_terms(row))
+    updates = ', '.join(f"{col} = {col} + excluded.{col}" for col in DAILY_STATS_COLUMNS)
+    return f"""
+        INSERT INTO user_stats_totals (email, {columns})
+        SELECT {row}.email, {values}
+        WHERE {row}.email IS NOT NULL
+        ON CONFLICT (email) DO UPDATE SET {updates};
+    """
+
+# 迁移5: 每个用户每天一行的统计汇总（总数、完成数、转移数、各情绪数），
+# 与日志写入在同一事务中由触发器更新，get_stats只需累加汇总行
+def _migrate_daily_user_stats(cursor):
+    counters = ',\n'.join(f"            {col} INTEGER NOT NULL DEFAULT 0" for col in DAILY_STATS_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            email TEXT NOT NULL,
+            day TEXT NOT NULL,
+{counters},
+            PRIMARY KEY (email, day)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute('DELETE FROM daily_user_stats')
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_daily_stats_insert AFTER INSERT ON logs
+        BEGIN {_daily_stats_upsert('NEW', 1, LEGACY_TRANSITION_TERM)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_daily_stats_delete AFTER DELETE ON logs
+        BEGIN {_daily_stats_upsert('OLD', -1, LEGACY_TRANSITION_TERM)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_daily_stats_update
+        AFTER UPDATE OF email, time, day, emotion, completed, nft ON logs
+        BEGIN {_daily_stats_upsert('OLD', -1, LEGACY_TRANSITION_TERM)} {_daily_stats_upsert('NEW', 1, LEGACY_TRANSITION_TERM)} END
+    """)
+    # 回填已有日志
+    sums = ', '.join(f"SUM({term})" for term in _daily_stats_terms('logs', LEGACY_TRANSITION_TERM))
+    cursor.execute(f"""
+        INSERT INTO daily_user_stats (email, day, {', '.join(DAILY_STATS_COLUMNS)})
+        SELECT email, COALESCE(day, date(time), ''), {sums}
+        FROM logs WHERE email IS NOT NULL
+        GROUP BY email, COALESCE(day, date(time), '')
+    """)
+
+# 迁移6: 用户时区列和每个用户的连续打卡状态（当前连续天数、最后完成日、最长连续天数），
+# 已有记录按服务器本地日期回填
+def _migrate_user_streaks(cursor):
+    if 'timezone' not in _table_columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN timezone TEXT')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_streaks (
+            email TEXT PRIMARY KEY,
+            current_streak INTEGER NOT NULL DEFAULT 0,
+            longest_streak INTEGER NOT NULL DEFAULT 0,
+            last_day TEXT
+        )
+    ''')
+    cursor.execute('DELETE FROM user_streaks')
+    cursor.execute('''
+        SELECT DISTINCT email, day FROM logs
+        WHERE completed = 1 AND email IS NOT NULL AND day IS NOT NULL
+        ORDER BY email, day
+    ''')
+    streaks = {}
+    for email, day in cursor.fetchall():
+        current, longest, last_day = streaks.get(email, (0, 0, None))
+        day_date = datetime.strptime(day, '%Y-%m-%d').date()
+        if last_day is not None and (day_date - last_day).days == 1:
+            current += 1
+        else:
+            current = 1
+        streaks[email] = (current, max(longest, current), day_date)
+    cursor.executemany(
+        'INSERT INTO user_streaks (email, current_streak, longest_streak, last_day) VALUES (?, ?, ?, ?)',
+        [(email, current, longest, last_day.isoformat()) for email, (current, longest, last_day) in streaks.items()]
+    )
+
+# 迁移7: 日志增加结构化的情绪转移（transition_from、transition_to），按徽章文字回填已有记录，
+# 日汇总的转移数改为按transition_to统计并重新计算
+def _migrate_structured_transitions(cursor):
+    columns = _table_columns(cursor, 'logs')
+    if 'transition_from' not in columns:
+        cursor.execute('ALTER TABLE logs ADD COLUMN transition_from TEXT')
+    if 'transition_to' not in columns:
+        cursor.execute('ALTER TABLE logs ADD COLUMN transition_to TEXT')
+    for (prev_emotion, current_emotion), badge in TRANSITION_BADGES.items():
+        cursor.execute('''
+            UPDATE logs SET transition_from = ?, transition_to = ?
+            WHERE transition_to IS NULL AND instr(nft, ?) > 0
+        ''', (prev_emotion, current_emotion, badge))
+    # 通用的成功緩和徽章不知道转移前的情绪，只记录转移后的情绪
+    cursor.execute('''
+        UPDATE logs SET transition_to = emotion
+        WHERE transition_to IS NULL AND instr(nft, ?) > 0
+    ''', (GENERIC_TRANSITION_BADGE,))
+
+    cursor.execute('DROP TRIGGER IF EXISTS trg_logs_daily_stats_insert')
+    cursor.execute('DROP TRIGGER IF EXISTS trg_logs_daily_stats_delete')
+    cursor.execute('DROP TRIGGER IF EXISTS trg_logs_daily_stats_update')
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_daily_stats_insert AFTER INSERT ON logs
+        BEGIN {_daily_stats_upsert('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_daily_stats_delete AFTER DELETE ON logs
+        BEGIN {_daily_stats_upsert('OLD', -1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_daily_stats_update
+        AFTER UPDATE OF email, time, day, emotion, completed, transition_to ON logs
+        BEGIN {_daily_stats_upsert('OLD', -1)} {_daily_stats_upsert('NEW', 1)} END
+    """)
+    cursor.execute('DELETE FROM daily_user_stats')
+    sums = ', '.join(f"SUM({term})" for term in _daily_stats_terms('logs'))
+    cursor.execute(f"""
+        INSERT INTO daily_user_stats (email, day, {', '.join(DAILY_STATS_COLUMNS)})
+        SELECT email, COALESCE(day, date(time), ''), {sums}
+        FROM logs WHERE email IS NOT NULL
+        GROUP BY email, COALESCE(day, date(time), '')
+    """)
+
+# 迁移8: 归档日志和分片迁移时整批移动日志，计数器和每日统计应保持不变；
+# log_triggers_paused 表中有行时，插入/删除日志不更新计数器和每日统计（只在移动数据的事务内写入该表）
+def _migrate_pausable_log_triggers(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS log_triggers_paused (paused INTEGER)')
+    when = 'WHEN NOT EXISTS (SELECT 1 FROM log_triggers_paused)'
+    for name in ('trg_logs_counters_insert', 'trg_logs_counters_delete',
+                 'trg_logs_daily_stats_insert', 'trg_logs_daily_stats_delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_counters_insert AFTER INSERT ON logs {when}
+        BEGIN {_log_counter_upsert('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_counters_delete AFTER DELETE ON logs {when}
+        BEGIN {_log_counter_upsert('OLD', -1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_daily_stats_insert AFTER INSERT ON logs {when}
+        BEGIN {_daily_stats_upsert('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_logs_daily_stats_delete AFTER DELETE ON logs {when}
+        BEGIN {_daily_stats_upsert('OLD', -1)} END
+    """)
+
+# 迁移9: 每个用户一行的全部日志统计汇总，period=all 的统计只读一行，不再累加用户历史上每天的汇总行；
+# 与日汇总一样由可暂停的触发器维护，按日汇总表回填（日汇总表已包含归档日志）
+def _migrate_user_stats_totals(cursor):
+    counters = ',\n'.join(f"            {col} INTEGER NOT NULL DEFAULT 0" for col in DAILY_STATS_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS user_stats_totals (
+            email TEXT PRIMARY KEY,
+{counters}
+        )
+    """)
+    cursor.execute('DELETE FROM user_stats_totals')
+    when = 'WHEN NOT EXISTS (SELECT 1 FROM log_triggers_paused)'
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_stats_totals_insert AFTER INSERT ON logs {when}
+        BEGIN {_stats_totals_upsert('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_stats_totals_delete AFTER DELETE ON logs {when}
+        BEGIN {_stats_totals_upsert('OLD', -1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_stats_totals_update
+        AFTER UPDATE OF email, emotion, completed, transition_to ON logs
+        BEGIN {_stats_totals_upsert('OLD', -1)} {_stats_totals_upsert('NEW', 1)} END
+    """)
+    sums = ', '.join(f"SUM({col})" for col in DAILY_STATS_COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO user_stats_totals (email, {', '.join(DAILY_STATS_COLUMNS)})
+        SELECT email, {sums} FROM daily_user_stats GROUP BY email
+    """)
+
+# 数据库迁移列表: (版本号, 说明, 迁移函数)，只能在末尾追加，已发布的迁移不要修改
+MIGRATIONS = [
+    (1, '基础表结构', _migrate_base_schema),
+    (2, '兼容旧表结构', _migrate_reconcile_legacy),
+    (3, '日志时间戳、日期列和索引', _migrate_log_time_columns),
+    (4, '日志计数器', _migrate_log_counters),
+    (5, '每日统计汇总', _migrate_daily_user_stats),
+    (6, '连续打卡状态和用户时区', _migrate_user_streaks),
+    (7, '结构化情绪转移', _migrate_structured_transitions),
+    (8, '可暂停的日志统计触发器', _migrate_pausable_log_triggers),
+    (9, '用户全部日志统计汇总', _migrate_user_stats_totals),
+]
+
+# 执行未应用的迁移: 每个迁移在单独的事务中执行并记录版本号，失败时回滚该迁移；
+# 多个进程同时启动时，在写锁内重新读取版本号，已被其他进程执行的迁移直接跳过
+def migrate_db(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    ''')
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+    current = cursor.fetchone()[0]
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+            current = cursor.fetchone()[0]
+            if version <= current:
+                cursor.execute('COMMIT')
+                continue
+            migration(cursor)
+            cursor.execute('INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)',
+                           (version, description, datetime.now().isoformat()))
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        logger.info(f"資料庫遷移完成: 版本 {version} ({description})")
+        current = version
+    return current
+
+# 分片数据库文件路径
+def shard_path(index):
+    return DB_SHARD_PATTERN.format(index)
+
+# 用户所在的分片: 对user_id（不存在的用户用email）取CRC32再取模，与进程和重启无关
+def shard_index(key, shards=None):
+    return zlib.crc32(str(key).encode('utf-8')) % (shards or DB_SHARDS)
+
+# 存放用户数据的数据库文件: 启用分片时为各分片，否则为主库
+def data_db_paths():
+    return [shard_path(i) for i in range(DB_SHARDS)] or [DB_NAME]
+
+# 数据库对应的归档库路径
+def archive_path(path):
+    return os.path.splitext(path)[0] + '_archive.db'
+
+# 归档库表结构: 每个用户每月一个压缩块（按 (ts, time, log_id) 升序的日志行，JSON后zlib压缩），
+# 主键 (email, month) 即每个用户的归档索引，min_ts/max_ts 用于翻页时跳过不需要的块
+def init_archive_db(path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_archive (
+                email TEXT NOT NULL,
+                month TEXT NOT NULL,
+                user_id TEXT,
+                min_ts INTEGER NOT NULL,
+                max_ts INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (email, month)
+            )
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+
+# 初始化数据库（启用分片时各分片使用与主库相同的表结构，其中的users表不使用）
 def init_db():
     try:
-        with db_lock, sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            # 创建用户表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id TEXT PRIMARY KEY,
-                    email TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    user_name TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    last_login TEXT
-                )
-            ''')
-            
-            # 检查并添加缺失的user_name列（兼容旧数据库）
-            try:
-                cursor.execute("ALTER TABLE users ADD COLUMN user_name TEXT NOT NULL DEFAULT '用户'")
-                conn.commit()
-            except:
-                # 如果列已存在，忽略错误
-                pass
-            # 创建日志表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS logs (
-                    log_id TEXT PRIMARY KEY,
-                    user_id TEXT,
-                    email TEXT,
-                    time TEXT,
-                    emotion TEXT,
-                    task TEXT,
-                    nft TEXT,
-                    completed BOOLEAN,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            # 创建用户情绪表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_emotions (
-                    user_id TEXT PRIMARY KEY,
-                    last_emotion TEXT,
-                    last_update TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            conn.commit()
-        logger.info("資料庫初始化成功")
+        with db_lock:
+            for path in [DB_NAME] + [shard_path(i) for i in range(DB_SHARDS)]:
+                conn = sqlite3.connect(path, isolation_level=None)
+                try:
+                    version = migrate_db(conn)
+                finally:
+                    conn.close()
+            for path in data_db_paths():
+                init_archive_db(archive_path(path))
+        logger.info(f"資料庫初始化成功，結構版本: {version}，分片數: {DB_SHARDS}")
     except Exception as e:
         logger.error(f"資料庫初始化失敗: {e}")
 
-# 增强的情緒關鍵字字典 (包含强度权重)
-EMOTION_KEYWORDS = {
-    'anxious': [
-        ('焦慮', 2), ('擔心', 1), ('壓力', 2), ('緊張', 1), ('不安', 1), 
-        ('害怕', 2), ('恐慌', 3), ('慌張', 1), ('緊繃', 1), ('坐立不安', 2),
-        ('忐忑', 1), ('煩憂', 1), ('煩惱', 1), ('憂慮', 1), ('焦慮不安', 2)
-    ],
-    'sad': [
-        ('傷心', 2), ('難過', 2), ('沮喪', 2), ('孤單', 1), ('悲傷', 2), 
-        ('失落', 1), ('絕望', 3), ('惆悵', 1), ('憂鬱', 2), ('傷感', 1),
-        ('空虛', 2), ('鬱悶', 1), ('難受', 1), ('想哭', 1), ('寂寞', 1)
-    ],
-    'angry': [
-        ('生氣', 2), ('憤怒', 3), ('煩躁', 1), ('氣憤', 2), ('不滿', 1),
-        ('惱火', 2), ('惱怒', 2), ('暴跳如雷', 3), ('氣炸', 3), ('憤慨', 2),
-        ('不悅', 1), ('不爽', 1), ('討厭', 1), ('厭煩', 1), ('惱恨', 2)
-    ],
-    'happy': [
-        ('快樂', 2), ('開心', 2), ('興奮', 2), ('愉快', 1), ('滿足', 1),
-        ('開朗', 1), ('欣喜', 2), ('高興', 2), ('歡喜', 1), ('雀躍', 2),
-        ('愉悅', 1), ('欣慰', 1), ('幸福', 2), ('開懷', 1), ('喜悅', 2)
-    ],
-    'neutral': [
-        ('平靜', 1), ('正常', 1), ('沒事', 1), ('ok', 1), ('一般', 1),
-        ('平常', 1), ('普通', 1), ('淡定', 1), ('無感', 1), ('穩定', 1)
-    ]
-}
+# 按完成日志的日期计算连续打卡并写入（覆盖已有状态）: 连续的日期减去序号后相同，据此分段，
+# 最后一段为当前连续天数，最长一段为最长连续天数；days为返回 (email, day) 的子查询
+def _write_streaks(cursor, days, params):
+    cursor.execute(f"""
+        WITH days AS ({days}), runs AS (
+            SELECT email, day, julianday(day) - ROW_NUMBER() OVER (PARTITION BY email ORDER BY day) AS grp
+            FROM days
+        ), islands AS (
+            SELECT email, COUNT(*) AS length, MAX(day) AS last_day FROM runs GROUP BY email, grp
+        ), ranked AS (
+            SELECT email, length, last_day,
+                   FIRST_VALUE(length) OVER (PARTITION BY email ORDER BY last_day DESC) AS current
+            FROM islands
+        )
+        INSERT OR REPLACE INTO user_streaks (email, current_streak, longest_streak, last_day)
+        SELECT email, MAX(current), MAX(length), MAX(last_day) FROM ranked GROUP BY email
+    """, params)
+
+# 批量导入日志（暂停或删除触发器后写入）时补齐统计: rowid在 [first_rowid, last_rowid] 的新行累加到日志计数器、每日统计和用户汇总，
+# 连续打卡也按这些行计算（这些用户在范围外已有日志时，之后再调用 rebuild_streaks）。
+# 与导入的日志在同一事务中调用；按rowid范围读取（NOT INDEXED: 不走email索引逐行回表），分批调用时每次只排序一批数据
+def add_bulk_log_stats(cursor, first_rowid, last_rowid):
+    cursor.execute("""
+        WITH keyed AS (
+            SELECT email, emotion, COALESCE(day, date(time)) AS d, COUNT(*) AS n FROM logs NOT INDEXED
+            WHERE rowid BETWEEN ? AND ? AND email IS NOT NULL
+            GROUP BY email, emotion, d
+        ), expanded AS (
+            SELECT email, n,
+                   CASE e.k WHEN 0 THEN '' ELSE emotion END AS emotion,
+                   CASE p.k WHEN 0 THEN '' WHEN 1 THEN substr(d, 1, 4)
+                            WHEN 2 THEN substr(d, 1, 7) ELSE d END AS period
+            FROM keyed,
+                 (SELECT 0 AS k UNION ALL SELECT 1) e,
+                 (SELECT 0 AS k UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3) p
+        )
+        INSERT INTO log_counters (email, emotion, period, count)
+        SELECT email, emotion, period, SUM(n) FROM expanded
+        WHERE emotion IS NOT NULL AND period IS NOT NULL
+        GROUP BY email, emotion, period
+        ON CONFLICT (email, emotion, period) DO UPDATE SET count = count + excluded.count
+    """, (first_rowid, last_rowid))
+
+    sums = ', '.join(f"SUM({term})" for term in _daily_stats_terms('logs'))
+    updates = ', '.join(f"{col} = {col} + excluded.{col}" for col in DAILY_STATS_COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO daily_user_stats (email, day, {', '.join(DAILY_STATS_COLUMNS)})
+        SELECT email, COALESCE(day, date(time), ''), {sums}
+        FROM logs NOT INDEXED WHERE rowid BETWEEN ? AND ? AND email IS NOT NULL
+        GROUP BY email, COALESCE(day, date(time), '')
+        ON CONFLICT (email, day) DO UPDATE SET {updates}
+    """, (first_rowid, last_rowid))
+    cursor.execute(f"""
+        INSERT INTO user_stats_totals (email, {', '.join(DAILY_STATS_COLUMNS)})
+        SELECT email, {sums}
+        FROM logs NOT INDEXED WHERE rowid BETWEEN ? AND ? AND email IS NOT NULL
+        GROUP BY email
+        ON CONFLICT (email) DO UPDATE SET {updates}
+    """, (first_rowid, last_rowid))
+
+    _write_streaks(cursor, '''
+        SELECT DISTINCT email, day FROM logs NOT INDEXED
+        WHERE rowid BETWEEN ? AND ? AND completed = 1 AND email IS NOT NULL AND day IS NOT NULL
+    ''', (first_rowid, last_rowid))
+
+# 按用户的全部日志重新计算连续打卡
+def rebuild_streaks(cursor, emails):
+    emails = list(emails)
+    for i in range(0, len(emails), 500):
+        chunk = emails[i:i + 500]
+        _write_streaks(cursor, f'''
+            SELECT DISTINCT email, day FROM logs
+            WHERE completed = 1 AND day IS NOT NULL AND email IN ({', '.join('?' * len(chunk))})
+        ''', chunk)
 
 # 負面情緒定義 (用於轉移偵測)
 NEGATIVE_EMOTIONS = {'anxious', 'sad', 'angry'}
 POSITIVE_EMOTIONS = {'happy', 'neutral'}
 
-# 調節建議模板 (基於情緒生成，新增daily_task)
-SUGGESTIONS = {
-    'anxious': {
-        'tips': '深呼吸練習：吸氣4秒，憋氣4秒，吐氣4秒，重複5次。',
-        'daily_task': '去做一件放鬆的事，例如聽音樂或散步。',
-        'advice': '試著列出3件今天感恩的事，轉移焦點。',
-        'resources': '資源連結：https://www.headspace.com/meditation/anxiety (免費冥想App)',
-        'color': 'anxious'
-    },
-    'sad': {
-        'tips': '聽一首喜歡的歌，或散步10分鐘接觸陽光。',
-        'daily_task': '寫下3件讓你微笑的小事。',
-        'advice': '寫日記：今天有什麼小事讓你微笑？',
-        'resources': '資源連結：https://www.helpguide.org/articles/depression/coping-with-grief-and-loss.htm',
-        'color': 'sad'
-    },
-    'angry': {
-        'tips': '拳擊枕頭或快走5分鐘釋放能量。',
-        'daily_task': '做5分鐘運動來釋放怒氣。',
-        'advice': '問自己：這件事10年後還重要嗎？',
-        'resources': '資源連結：https://www.mayoclinic.org/healthy-lifestyle/adult-health/in-depth/anger-management/art-20045434',
-        'color': 'angry'
-    },
-    'happy': {
-        'tips': '記錄這一刻，分享給朋友！',
-        'daily_task': '計劃一個小慶祝活動。',
-        'advice': '延續正面：計劃下一個小目標。',
-        'resources': '資源連結：https://positivepsychology.com/happiness-activities-exercises-tools/',
-        'color': 'happy'
-    },
-    'neutral': {
-        'tips': '維持平衡：喝杯水，伸展身體。',
-        'daily_task': '反思一天的正面時刻。',
-        'advice': '反思一天：什麼讓你感覺好？',
-        'resources': '資源連結：https://www.mind.org.uk/information-support/tips-for-everyday-living/wellbeing/',
-        'color': 'neutral'
-    }
+# 從負面到正面的轉移徽章
+TRANSITION_BADGES = {
+    ('anxious', 'happy'): '🌟 平復之星 - 從焦慮到喜悅的轉變',
+    ('anxious', 'neutral'): '✨ 平靜之力 - 從焦慮到平靜的轉變',
+    ('sad', 'happy'): '🌈 快樂重生 - 從傷心到喜悅的蛻變',
+    ('sad', 'neutral'): '🌊 平靜如海 - 從傷心到平靜的治癒',
+    ('angry', 'happy'): '🌞 和平使者 - 從憤怒到喜悅的轉化',
+    ('angry', 'neutral'): '🌿 冷靜之心 - 從憤怒到平靜的掌控'
 }
+GENERIC_TRANSITION_BADGE = '🌟 成功緩和徽章 - 情緒管理的勝利'
 
-# NFT徽章定義
-NFT_BADGES = {
-    'anxious': '🛡️ 勇者徽章 - 戰勝焦慮',
-    'sad': '🌈 彩虹徽章 - 擁抱療癒',
-    'angry': '🔥 鳳凰徽章 - 轉化怒火',
-    'happy': '⭐ 星光徽章 - 喜悅守護',
-    'neutral': '⚖️ 平衡徽章 - 平靜之源'
-}
+# 词库匹配器: 把关键词、否定词和中性表达编译成一个Aho-Corasick自动机，
+# 对输入只扫描一遍即可得到全部加权命中
+class EmotionMatcher:
+    KEYWORD, NEGATION, NEUTRAL = 0, 1, 2
+
+    def __init__(self, emotion_keywords, negations=(), neutral_phrases=()):
+        self.emotions = list(emotion_keywords)
+        # 词库内容的指纹，词库变化时版本随之变化（用于缓存失效）
+        self.version = hashlib.sha1(json.dumps(
+            [emotion_keywords, list(negations), list(neutral_phrases)],
+            ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+        # 状态转移表、失败指针、每个状态命中的模式编号
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        # 每个模式对应的命中项: (类型, 情绪, 权重)，同一个词可能对应多项
+        self._payloads = []
+        pattern_ids = {}
+
+        def add(pattern, payload):
+            pattern = pattern.lower()
+            if not pattern:
+                return
+            pid = pattern_ids.get(pattern)
+            if pid is None:
+                pid = pattern_ids[pattern] = len(self._payloads)
+                self._payloads.append([])
+                state = 0
+                for ch in pattern:
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append([])
+                    state = nxt
+                self._out[state].append(pid)
+            self._payloads[pid].append(payload)
+
+        for emotion, keyword_list in emotion_keywords.items():
+            for kw, weight in keyword_list:
+                add(kw, (self.KEYWORD, emotion, weight))
+        for neg in negations:
+            add(neg, (self.NEGATION, None, 0))
+        for phrase in neutral_phrases:
+            add(phrase, (self.NEUTRAL, None, 0))
+
+        # 按BFS顺序计算失败指针，并把后缀状态的输出合并进来
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    # 从给定状态继续扫描一段已小写的文本，命中的模式编号加入hits，返回结束状态；
+    # 分块扫描时把上一块的结束状态传入下一块，跨块边界的关键词也能正确命中
+    def feed(self, state, chunk_lower, hits):
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        for ch in chunk_lower:
+            if state == 0:
+                state = root.get(ch, 0)
+            else:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.update(out[state])
+        return state
+
+    # 扫描已小写的文本，返回命中的模式编号集合
+    def scan(self, text_lower):
+        hits = set()
+        self.feed(0, text_lower, hits)
+        return hits
+
+    # 汇总命中: 各情绪得分、命中的情感词数量、是否有否定词/中性表达
+    def summarize(self, hits):
+        scores = {emotion: 0 for emotion in self.emotions}
+        emotion_word_count = 0
+        has_negation = False
+        has_neutral_phrase = False
+        for pid in hits:
+            for kind, emotion, weight in self._payloads[pid]:
+                if kind == self.KEYWORD:
+                    scores[emotion] += weight
+                    emotion_word_count += 1
+                elif kind == self.NEGATION:
+                    has_negation = True
+                else:
+                    has_neutral_phrase = True
+        return scores, emotion_word_count, has_negation, has_neutral_phrase
+
+    # 单次扫描后汇总
+    def match(self, text_lower):
+        return self.summarize(self.scan(text_lower))
+
+# 情绪词库: 关键词权重、否定词、中性表达、建议模板和NFT徽章，
+# 从带版本号的词库文件加载，并在加载时预编译匹配器
+class Lexicon:
+    def __init__(self, data, mtime=None):
+        self.version = str(data['version'])
+        self.emotion_keywords = {
+            emotion: [(kw, int(weight)) for kw, weight in keyword_list]
+            for emotion, keyword_list in data['emotion_keywords'].items()
+        }
+        self.negations = list(data.get('negations', []))
+        self.neutral_phrases = list(data.get('neutral_phrases', []))
+        self.suggestions = data['suggestions']
+        self.nft_badges = data['nft_badges']
+        self.mtime = mtime
+
+        # 每个情绪都必须有对应的建议模板和徽章
+        for emotion in list(self.emotion_keywords) + ['neutral']:
+            if emotion not in self.suggestions or emotion not in self.nft_badges:
+                raise ValueError(f"詞庫缺少情緒 {emotion} 的建議或徽章")
+
+        self.matcher = EmotionMatcher(self.emotion_keywords, self.negations, self.neutral_phrases)
+
+# 读取并编译词库文件
+def load_lexicon(path):
+    mtime = os.stat(path).st_mtime
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return Lexicon(data, mtime)
+
+# 启动时加载并编译一次词库
+_lexicon = load_lexicon(LEXICON_PATH)
+
+# 获取当前生效的词库（一次请求内应只取一次，保证结果来自同一版本）
+def get_lexicon():
+    return _lexicon
+
+# 后台监视词库文件: 文件变化后在监视线程中加载并预编译新版本，再原子替换
+def watch_lexicon(interval=None):
+    global _lexicon
+    interval = interval or LEXICON_POLL_INTERVAL
+    last_mtime = _lexicon.mtime
+    while True:
+        time.sleep(interval)
+        try:
+            mtime = os.stat(LEXICON_PATH).st_mtime
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            new_lexicon = load_lexicon(LEXICON_PATH)
+            old_version = _lexicon.version
+            _lexicon = new_lexicon
+            logger.info(f"詞庫已熱更新: {old_version} -> {new_lexicon.version}")
+        except Exception as e:
+            # 新版本有问题时继续使用旧版本，等文件再次变化后重试
+            logger.error(f"詞庫熱更新失敗，繼續使用版本 {_lexicon.version}: {e}")
+
+def start_lexicon_watcher():
+    t = threading.Thread(target=watch_lexicon, name='lexicon-watcher', daemon=True)
+    t.start()
+    return t
+
+# 按块扫描文本: 每块单独小写后接着上一块的自动机状态继续匹配，
+# 不会生成整段文本的小写副本；累计超过max_chars后停止扫描
+def scan_text_chunks(chunks, matcher, max_chars=None):
+    max_chars = max_chars or MAX_EMOTION_SCAN_CHARS
+    hits = set()
+    state = 0
+    scanned = 0
+    truncated = False
+    has_content = False
+    preview = ''
+    for chunk in chunks:
+        if scanned + len(chunk) > max_chars:
+            chunk = chunk[:max_chars - scanned]
+            truncated = True
+        if not has_content and chunk.strip():
+            has_content = True
+        if len(preview) < 30:
+            preview += chunk[:30 - len(preview)]
+        state = matcher.feed(state, chunk.lower(), hits)
+        scanned += len(chunk)
+        if truncated:
+            break
+    return {
+        'hits': hits,
+        'chars_scanned': scanned,
+        'truncated': truncated,
+        'has_content': has_content,
+        'preview': preview.strip()
+    }
+
+# 把字符串切成固定大小的块
+def iter_text_chunks(text, size=None):
+    size = size or EMOTION_SCAN_CHUNK
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+# 增量解码请求体: 按块读取字节流并用增量解码器处理跨块的多字节字符
+def iter_stream_text(stream, read_size=None):
+    read_size = read_size or STREAM_READ_BYTES
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+            return
+        text = decoder.decode(data)
+        if text:
+            yield text
+
+# 根据扫描结果确定情绪
+def resolve_emotion(matcher, hits, char_count):
+    scores, emotion_word_count, has_negation, has_neutral_phrase = matcher.summarize(hits)
 
-# 增强的情緒偵測函數
-def detect_emotion(text):
-    if not text or not isinstance(text, str):
-        return 'neutral'
-    
-    text_lower = text.lower()
-    scores = {emotion: 0 for emotion in EMOTION_KEYWORDS}
-    
-    # 计算基础分数
-    for emotion, keyword_list in EMOTION_KEYWORDS.items():
-        for kw, weight in keyword_list:
-            if kw.lower() in text_lower:
-                scores[emotion] += weight
-    
     # 计算总分数
     total_score = sum(scores.values())
-    
+
     if total_score == 0:
         # 没有匹配到关键词，尝试二次分析
-        # 检查否定词和程度词
-        negations = ['不', '沒有', '不是', '並非', '不覺得']
-        has_negation = any(neg in text_lower for neg in negations)
-        
-        # 检查情感词密集度
-        emotion_words = []
-        for emotion, keyword_list in EMOTION_KEYWORDS.items():
-            emotion_words.extend([kw for kw, _ in keyword_list])
-        
-        # 计算文本长度和情感词数量
-        char_count = len(text)
-        emotion_word_count = sum(1 for word in emotion_words if word.lower() in text_lower)
-        
         # 如果有否定词或者情感词密度很低，返回neutral
         if has_negation or (char_count > 20 and emotion_word_count == 0):
             return 'neutral'
-        
+
         # 最后尝试一些常见的中性表达
-        neutral_phrases = ['沒什麼', '還好', '一般般', '普通', '正常', '可以']
-        for phrase in neutral_phrases:
-            if phrase.lower() in text_lower:
-                return 'neutral'
-    
+        if has_neutral_phrase:
+            return 'neutral'
+
     # 返回得分最高的情绪
     dominant = max(scores, key=scores.get)
     return dominant if scores[dominant] > 0 else 'neutral'
 
+# 增强的情緒偵測函數
+def detect_emotion(text, lexicon=None):
+    if not text or not isinstance(text, str):
+        return 'neutral'
+
+    lexicon = lexicon or get_lexicon()
+
+    # 分块一次扫描得到全部命中
+    result = scan_text_chunks(iter_text_chunks(text), lexicon.matcher)
+    return resolve_emotion(lexicon.matcher, result['hits'], len(text))
+
+# 逐块读取请求体文本；累计超过扫描上限后不再继续读取
+def iter_stream_chunks(stream, max_chars=None):
+    max_chars = max_chars or MAX_EMOTION_SCAN_CHARS
+    total = 0
+    for chunk in iter_stream_text(stream):
+        yield chunk
+        total += len(chunk)
+        if total > max_chars:
+            return
+
+# 读取请求体文本，最多保留扫描上限多一个字符（用于判断是否截断），超过的部分不再读取
+def read_stream_text(stream, max_chars=None):
+    max_chars = max_chars or MAX_EMOTION_SCAN_CHARS
+    return ''.join(iter_stream_chunks(stream, max_chars))[:max_chars + 1]
+
+# 带TTL的有界LRU缓存，用于缓存重复出现的短文本的情绪检测结果
+class EmotionCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # 词库版本变化时整体失效
+    def _check_version(self, version):
+        if version != self._version:
+            self.evictions += len(self._data)
+            self._data.clear()
+            self._version = version
+
+    def get(self, version, text):
+        with self._lock:
+            self._check_version(version)
+            item = self._data.get((version, text))
+            if item is not None:
+                if item[1] > time.monotonic():
+                    self._data.move_to_end((version, text))
+                    self.hits += 1
+                    return item[0]
+                # 已过期
+                del self._data[(version, text)]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, version, text, value):
+        with self._lock:
+            self._check_version(version)
+            self._data[(version, text)] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end((version, text))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'lexicon_fingerprint': self._version
+            }
+
+emotion_cache = EmotionCache(EMOTION_CACHE_SIZE, EMOTION_CACHE_TTL)
+
+# 缓存键: 只缓存短文本，规范化为小写并合并空白（关键词不含空白，不影响检测结果）
+def emotion_cache_key(text):
+    if not text or not isinstance(text, str) or len(text) > EMOTION_CACHE_MAX_TEXT:
+        return None
+    return ' '.join(text.lower().split())
+
 # 生成基本NFT徽章
-def generate_nft_badge(emotion):
-    badge = NFT_BADGES.get(emotion, NFT_BADGES['neutral'])
+def generate_nft_badge(emotion, lexicon=None):
+    nft_badges = (lexicon or get_lexicon()).nft_badges
+    badge = nft_badges.get(emotion, nft_badges['neutral'])
     logger.info(f"生成NFT徽章: {badge} (情绪: {emotion})")
     return badge
 
@@ -251,16 +1067,7 @@ def generate_nft_badge(emotion):
 def generate_transition_nft(prev_emotion, current_emotion):
     # 从负面到正面的转移
     if prev_emotion in NEGATIVE_EMOTIONS and current_emotion in POSITIVE_EMOTIONS:
-        transition_mapping = {
-            ('anxious', 'happy'): '🌟 平復之星 - 從焦慮到喜悅的轉變',
-            ('anxious', 'neutral'): '✨ 平靜之力 - 從焦慮到平靜的轉變',
-            ('sad', 'happy'): '🌈 快樂重生 - 從傷心到喜悅的蛻變',
-            ('sad', 'neutral'): '🌊 平靜如海 - 從傷心到平靜的治癒',
-            ('angry', 'happy'): '🌞 和平使者 - 從憤怒到喜悅的轉化',
-            ('angry', 'neutral'): '🌿 冷靜之心 - 從憤怒到平靜的掌控'
-        }
-        special_badge = transition_mapping.get((prev_emotion, current_emotion), 
-                                              '🌟 成功緩和徽章 - 情緒管理的勝利')
+        special_badge = TRANSITION_BADGES.get((prev_emotion, current_emotion), GENERIC_TRANSITION_BADGE)
         logger.info(f"生成特殊NFT: {special_badge} (从{prev_emotion}到{current_emotion})")
         return special_badge
     
@@ -270,18 +1077,1017 @@ def generate_transition_nft(prev_emotion, current_emotion):
     
     return None
 
+# 根据情绪组装建议包和基本NFT徽章
+def build_suggestion(emotion, lexicon=None):
+    lexicon = lexicon or get_lexicon()
+    pkg = lexicon.suggestions.get(emotion, lexicon.suggestions['neutral'])
+
+    return {
+        'emotion': emotion,
+        'package': {
+            'tips': pkg['tips'],
+            'daily_task': pkg['daily_task'],
+            'advice': pkg['advice'],
+            'resources': pkg['resources'],
+            'color': pkg['color']
+        },
+        'nft': generate_nft_badge(emotion, lexicon),
+        'transition_nft': '',
+        'transition': None,
+        'lexicon_version': lexicon.version
+    }
+
+# 檢查情緒轉移，在建议结果上叠加特殊NFT；prev_emotion为上次情绪
+def apply_transition(result, prev_emotion=None, task_completed=False):
+    if prev_emotion and task_completed:
+        transition_nft = generate_transition_nft(prev_emotion, result['emotion'])
+        if transition_nft:
+            result['transition_nft'] = ' + ' + transition_nft
+            result['nft'] += result['transition_nft']
+            # 從負面到正面的轉移以結構化數據返回，由add-log記錄
+            if prev_emotion in NEGATIVE_EMOTIONS and result['emotion'] in POSITIVE_EMOTIONS:
+                result['transition'] = {'from': prev_emotion, 'to': result['emotion']}
+    return result
+
+# 日誌的情緒轉移: 優先使用客戶端傳來的結構化數據，否則從徽章文字解析；不是轉移時返回 (None, None)
+def resolve_transition(emotion, nft, transition_from=None, transition_to=None):
+    if transition_to:
+        if transition_to in POSITIVE_EMOTIONS and (transition_from is None or transition_from in NEGATIVE_EMOTIONS):
+            return transition_from, transition_to
+        return None, None
+    if not isinstance(nft, str):
+        return None, None
+    for (prev_emotion, current_emotion), badge in TRANSITION_BADGES.items():
+        if badge in nft:
+            return prev_emotion, current_emotion
+    if GENERIC_TRANSITION_BADGE in nft:
+        return None, emotion
+    return None, None
+
+# 执行器已满时拒绝任务
+class ExecutorBusy(Exception):
+    pass
+
+# 有界执行器: 限制同时执行和排队的任务总数，满了立即拒绝，避免请求无限堆积
+class BoundedExecutor:
+    def __init__(self, name, executor_factory, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._factory = executor_factory
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    # 首次使用时才创建底层执行器；执行器损坏（如工作进程崩溃）后重建
+    def _get_executor(self, reset=False):
+        with self._lock:
+            if reset:
+                self._executor = None
+            if self._executor is None:
+                self._executor = self._factory(self.max_workers)
+            return self._executor
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ExecutorBusy(self.name)
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenExecutor:
+                future = self._get_executor(reset=True).submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    # 提交任务并等待结果，超时抛出FutureTimeoutError（超时的任务仍占用名额直到结束）
+    def run(self, fn, *args, timeout=None):
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self.timeouts += 1
+            raise
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+# 工作进程使用的词库: 主进程已热更新（指纹不同）且文件有变化时重新加载
+def _task_lexicon(fingerprint):
+    global _lexicon
+    lexicon = get_lexicon()
+    if lexicon.matcher.version == fingerprint or multiprocessing.parent_process() is None:
+        return lexicon
+    if os.stat(LEXICON_PATH).st_mtime != lexicon.mtime:
+        _lexicon = lexicon = load_lexicon(LEXICON_PATH)
+    return lexicon
+
+# 进程池任务: 检测单条文本的情绪并组装建议（情绪转移依赖数据库，在请求线程中处理）
+def classify_text_task(text, fingerprint):
+    lexicon = _task_lexicon(fingerprint)
+    return build_suggestion(detect_emotion(text, lexicon), lexicon)
+
+# 进程池任务: 按顺序检测一批文本
+def classify_batch_task(texts, fingerprint):
+    lexicon = _task_lexicon(fingerprint)
+    return [build_suggestion(detect_emotion(text, lexicon), lexicon) for text in texts]
+
+# 分块扫描长文本，返回 (建议, 扫描信息)；没有有效内容时建议为None
+def classify_chunks(chunks, lexicon):
+    result = scan_text_chunks(chunks, lexicon.matcher)
+    hits = result.pop('hits')
+    if not result.pop('has_content'):
+        return None, result
+    emotion = resolve_emotion(lexicon.matcher, hits, result['chars_scanned'])
+    return build_suggestion(emotion, lexicon), result
+
+# 情绪分类进程池，与Flask请求线程分离，长文本不会占用Web进程的GIL
+classify_pool = BoundedExecutor(
+    'classify',
+    lambda n: ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context('spawn')),
+    CLASSIFY_WORKERS, CLASSIFY_MAX_QUEUE
+) if CLASSIFY_WORKERS > 0 else None
+
+# 执行分类任务: 启用进程池时提交到进程池并等待，否则在请求线程内执行
+def run_classification(task, payload, lexicon):
+    fingerprint = lexicon.matcher.version
+    if classify_pool is None:
+        return task(payload, fingerprint)
+    return classify_pool.run(task, payload, fingerprint, timeout=CLASSIFY_TIMEOUT)
+
+# 进程池任务: 分块扫描流式请求体的文本（读取时已截断到扫描上限），返回 (建议, 扫描信息)
+def classify_chunks_task(text, fingerprint):
+    return classify_chunks(iter_text_chunks(text), _task_lexicon(fingerprint))
+
+# 检测流式请求体的情绪: 读取到扫描上限为止，短文本在请求线程中扫描，
+# 较长的交给进程池，长篇日记不会占用Web进程的GIL
+def classify_stream(stream, lexicon):
+    text = read_stream_text(stream)
+    if len(text) <= STREAM_INLINE_CHARS:
+        return classify_chunks(iter_text_chunks(text), lexicon)
+    return run_classification(classify_chunks_task, text, lexicon)
+
+# 检测情绪并组装建议: 短文本先查缓存，未命中时交给进程池
+def classify_and_suggest(text, lexicon):
+    key = emotion_cache_key(text)
+    version = lexicon.matcher.version
+    if key is not None:
+        emotion = emotion_cache.get(version, key)
+        if emotion is not None:
+            return build_suggestion(emotion, lexicon)
+
+    result = run_classification(classify_text_task, text, lexicon)
+    if key is not None and result['lexicon_version'] == lexicon.version:
+        emotion_cache.put(version, key, result['emotion'])
+    return result
+
+# 批量检测: 命中缓存的直接组装，其余作为一个任务交给进程池
+def classify_and_suggest_batch(texts, lexicon):
+    version = lexicon.matcher.version
+    results = [None] * len(texts)
+    misses = []
+    for i, text in enumerate(texts):
+        key = emotion_cache_key(text)
+        emotion = emotion_cache.get(version, key) if key is not None else None
+        if emotion is not None:
+            results[i] = build_suggestion(emotion, lexicon)
+        else:
+            misses.append(i)
+
+    if misses:
+        computed = run_classification(classify_batch_task, [texts[i] for i in misses], lexicon)
+        for i, result in zip(misses, computed):
+            results[i] = result
+            key = emotion_cache_key(texts[i])
+            if key is not None and result['lexicon_version'] == lexicon.version:
+                emotion_cache.put(version, key, result['emotion'])
+    return results
+
+# 密码哈希执行器: bcrypt计算时会释放GIL，放在独立的有界线程池中执行，
+# 登录高峰时排队满了直接拒绝，不会占满所有Web线程
+bcrypt_pool = BoundedExecutor(
+    'bcrypt',
+    lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix='bcrypt'),
+    BCRYPT_WORKERS, BCRYPT_MAX_QUEUE
+)
+
+# 工具函数: 加密密码
+def hash_password(password):
+    hashed = bcrypt_pool.run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(),
+                             timeout=BCRYPT_TIMEOUT)
+    return hashed.decode('utf-8')
+
+# 工具函数: 校验密码
+def check_password(password, hashed):
+    return bcrypt_pool.run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'),
+                           timeout=BCRYPT_TIMEOUT)
+
+# 执行器繁忙时返回503，并通过Retry-After提示客户端稍后重试
+def busy_response(message):
+    response = jsonify({
+        'success': False,
+        'message': message
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
 # 工具函数: 验证邮箱格式
 def is_valid_email(email):
     email_pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
     return re.match(email_pattern, email) is not None
 
-# 工具函数: 获取数据库连接
+# 工具函数: 把各种类型的情绪输入统一转换为去除首尾空白的字符串
+def normalize_emotion_input(user_input):
+    # 确保user_input是字符串 - 全面的类型处理
+    if user_input is None:
+        user_input = ''
+    elif not isinstance(user_input, str):
+        # 如果是字典，尝试各种方式提取字符串内容
+        if isinstance(user_input, dict):
+            # 1. 尝试获取text字段
+            if 'text' in user_input:
+                user_input = user_input['text']
+            # 2. 尝试获取第一个非空值
+            elif user_input:
+                for key, value in user_input.items():
+                    if isinstance(value, str) and value.strip():
+                        user_input = value
+                        break
+                # 如果没有找到合适的值，使用第一个值
+                else:
+                    first_value = next(iter(user_input.values()), '')
+                    user_input = str(first_value)
+            else:
+                user_input = ''
+        # 对于其他非字符串类型，转换为字符串
+        else:
+            try:
+                user_input = str(user_input)
+            except:
+                user_input = ''
+    
+    if not isinstance(user_input, str):
+        user_input = str(user_input)
+    
+    # 去除首尾空白字符
+    return user_input.strip()
+
+# 建立数据库连接并设置PRAGMA: WAL、synchronous=NORMAL、忙等待、页缓存、mmap
+def connect_db(path, **kwargs):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False, **kwargs)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+# SQLite连接池: 每个连接只在创建时设置一次PRAGMA（WAL、synchronous=NORMAL、页缓存、mmap、忙等待），
+# 请求结束后归还复用，不再每个请求重新建立连接
+class ConnectionPool:
+    def __init__(self, path, size, timeout):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        # 后进先出: 最近用过的连接页缓存更热
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._waits = 0
+        self._exhausted = 0
+
+    def _connect(self):
+        return connect_db(self.path)
+
+    # 取出一个连接: 优先复用空闲连接，未满时新建，否则等待归还
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+                else:
+                    self._waits += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._exhausted += 1
+                    raise sqlite3.OperationalError('数据库连接池已耗尽')
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    # 归还连接: 回滚未提交的事务；连接已损坏时丢弃，下次按需重建
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"丟棄損壞的數據庫連接: {e}")
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'waits': self._waits,
+                'exhausted': self._exhausted
+            }
+
+db_pool = ConnectionPool(DB_NAME, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+shard_pools = [ConnectionPool(shard_path(i), DB_POOL_SIZE, DB_POOL_TIMEOUT) for i in range(DB_SHARDS)]
+# 归档库只在翻页超过热数据时读取，与 data_db_paths() 一一对应
+archive_pools = [ConnectionPool(archive_path(path), DB_POOL_SIZE, DB_POOL_TIMEOUT) for path in data_db_paths()]
+
+# 工具函数: 获取数据库连接（从连接池取出，请求结束时归还）
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(DB_NAME)
+        g.db = db_pool.acquire()
         # 移除row_factory设置，让查询返回元组格式
     return g.db
 
+# 获取分片的数据库连接，同一请求内复用
+def get_shard_db(index):
+    if 'shard_dbs' not in g:
+        g.shard_dbs = {}
+    if index not in g.shard_dbs:
+        g.shard_dbs[index] = shard_pools[index].acquire()
+    return g.shard_dbs[index]
+
+# 没有令牌时在主库按email查询user_id和时区，用户不存在时返回False
+def resolve_user(cursor, identity):
+    cursor.execute('SELECT user_id, timezone FROM users WHERE email = ?', (identity['email'],))
+    row = cursor.fetchone()
+    if row:
+        identity['user_id'] = row[0]
+    identity['timezone'] = normalize_timezone(row[1]) if row else None
+    return row is not None
+
+# 用户所在的分片，未启用分片时为None；没有令牌的请求先查询user_id和时区
+def user_shard(identity):
+    if not DB_SHARDS:
+        return None
+    if not identity['user_id'] and 'timezone' not in identity:
+        resolve_user(get_db().cursor(), identity)
+    return shard_index(identity['user_id'] or identity['email'])
+
+# 获取用户数据（日志、统计、连续打卡、上次情绪）所在的连接: 未启用分片时就是主库连接，
+# 启用分片时之后的查询都只访问该用户的分片
+def get_user_db(identity):
+    index = user_shard(identity)
+    return get_db() if index is None else get_shard_db(index)
+
+# 获取用户的归档库连接，同一请求内复用
+def get_archive_db(identity):
+    index = user_shard(identity) or 0
+    if 'archive_dbs' not in g:
+        g.archive_dbs = {}
+    if index not in g.archive_dbs:
+        g.archive_dbs[index] = archive_pools[index].acquire()
+    return g.archive_dbs[index]
+
+# 组提交写入队列: 单独的写线程从队列中取出写操作，凑满一批或时间窗口结束后在一个事务中提交，
+# 多个请求共用一次提交；每个操作在自己的保存点中执行，单个失败不影响同批的其他操作
+class GroupCommitWriter:
+    def __init__(self, path, max_batch, window, max_queue):
+        self.path = path
+        self.max_batch = max_batch
+        self.window = window
+        self.max_queue = max_queue
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.ops = 0
+        self.failed_ops = 0
+        self.rejected = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+        self.commit_ms_total = 0.0
+
+    # 首次提交时才启动写线程
+    def _ensure_started(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('寫入隊列已關閉')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    # 提交写操作 fn(cursor, *args)，返回Future，在所在批次提交后完成；队列满时立即拒绝
+    def submit(self, fn, *args):
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((fn, args, future))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy('writer')
+        return future
+
+    # 提交写操作；wait为True时等待提交完成（数据已写入数据库）并返回结果
+    def run(self, fn, *args, wait=True, timeout=None):
+        future = self.submit(fn, *args)
+        if wait:
+            return future.result(timeout=timeout)
+        return future
+
+    def _run(self):
+        conn = connect_db(self.path, isolation_level=None)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                self._commit(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for fn, args, future in batch:
+                cursor.execute('SAVEPOINT write_op')
+                try:
+                    outcomes.append((future, fn(cursor, *args), None))
+                    cursor.execute('RELEASE write_op')
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_op')
+                    cursor.execute('RELEASE write_op')
+                    outcomes.append((future, None, e))
+            cursor.execute('COMMIT')
+        except Exception as e:
+            logger.error(f"批量寫入提交失敗: {e}")
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            with self._lock:
+                self.failed_ops += len(batch)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.ops += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.commit_ms_total += (time.perf_counter() - start) * 1000
+        for future, result, error in outcomes:
+            if error is not None:
+                with self._lock:
+                    self.failed_ops += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # 停止接收新的写操作，写完队列中剩余的操作后退出
+    def close(self, timeout=None):
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'max_batch': self.max_batch,
+                'window_ms': round(self.window * 1000, 2),
+                'batches': self.batches,
+                'ops': self.ops,
+                'failed_ops': self.failed_ops,
+                'rejected': self.rejected,
+                'last_batch_size': self.last_batch_size,
+                'max_batch_seen': self.max_batch_seen,
+                'avg_batch_size': round(self.ops / self.batches, 2) if self.batches else 0,
+                'avg_commit_ms': round(self.commit_ms_total / self.batches, 3) if self.batches else 0
+            }
+
+write_queue = GroupCommitWriter(
+    DB_NAME, WRITE_BATCH_SIZE, WRITE_BATCH_WINDOW_MS / 1000, WRITE_MAX_QUEUE
+) if WRITE_BATCH_SIZE > 0 else None
+
+# 每个分片一个写线程，不同分片的写入互不阻塞
+shard_writers = [GroupCommitWriter(
+    shard_path(i), WRITE_BATCH_SIZE, WRITE_BATCH_WINDOW_MS / 1000, WRITE_MAX_QUEUE
+) if WRITE_BATCH_SIZE > 0 else None for i in range(DB_SHARDS)]
+
+# 执行写操作: 启用写入队列时交给写线程组提交，否则在请求连接上直接执行并提交；
+# wait为False时不等待提交完成；启用分片时按user_id写入该用户的分片
+def run_write(fn, *args, wait=True, user_id=None):
+    index = shard_index(user_id) if DB_SHARDS and user_id else None
+    writer = write_queue if index is None else shard_writers[index]
+    if writer is None:
+        conn = get_db() if index is None else get_shard_db(index)
+        with conn:
+            return fn(conn.cursor(), *args)
+    if wait:
+        return writer.run(fn, *args, timeout=WRITE_TIMEOUT)
+    return writer.submit(fn, *args)
+
+# 写操作: 保存上次情绪
+def write_last_emotion(cursor, user_id, emotion, updated_at):
+    cursor.execute(
+        'INSERT OR REPLACE INTO user_emotions (user_id, last_emotion, last_update) VALUES (?, ?, ?)',
+        (user_id, emotion, updated_at)
+    )
+
+# 本进程已交给写入队列、尚未提交的上次情绪: user_id -> (情绪, Future)，提交完成（或失败）后移除
+pending_last_emotions = {}
+pending_last_emotions_lock = threading.Lock()
+
+def _clear_pending_last_emotion(user_id, future):
+    with pending_last_emotions_lock:
+        if pending_last_emotions.get(user_id, (None, None))[1] is future:
+            del pending_last_emotions[user_id]
+
+# 保存上次情绪: 交给写入队列，不等待提交；提交前本进程读取时使用待写入的值
+def save_last_emotion(user_id, emotion):
+    future = run_write(write_last_emotion, user_id, emotion, datetime.now().isoformat(),
+                       wait=False, user_id=user_id)
+    if future is None:
+        return
+    with pending_last_emotions_lock:
+        pending_last_emotions[user_id] = (emotion, future)
+    future.add_done_callback(lambda f: _clear_pending_last_emotion(user_id, f))
+
+# 写操作: 插入日志，完成任务时同时更新连续打卡状态
+def write_log(cursor, row, streak_day=None):
+    cursor.execute(
+        '''INSERT INTO logs 
+           (log_id, user_id, email, time, ts, day, emotion, task, nft, completed,
+            transition_from, transition_to) 
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        row
+    )
+    if streak_day is not None:
+        record_streak(cursor, row[2], streak_day)
+
+# 日期过滤条件: 完整日期按day等值匹配，年份或年月前缀按day范围匹配，都能使用索引
+def day_filter(date_filter):
+    if len(date_filter) == 10:
+        return " AND day = ?", [date_filter]
+    return " AND day >= ? AND day < ?", [date_filter, date_filter + '~']
+
+# 工具函数: base64url编码/解码（不带填充）
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+# 可直接由日志计数器得到总数的日期过滤: 年、年月或完整日期
+COUNTER_PERIOD_RE = re.compile(r'^\d{4}(-\d{2}(-\d{2})?)?$')
+
+# 查询日志总数（包括已归档的日志）: 能用计数器时直接读取，否则分别统计日志表和归档块中符合条件的日志；
+# archive_cursor 是返回归档库游标的函数，只在需要统计归档块时才调用（才从连接池取得归档库连接）
+def count_logs(cursor, archive_cursor, email, emotion_filter=None, date_filter=None):
+    if not date_filter or COUNTER_PERIOD_RE.match(date_filter):
+        cursor.execute('SELECT count FROM log_counters WHERE email = ? AND emotion = ? AND period = ?',
+                       (email, emotion_filter or '', date_filter or ''))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    return (count_hot_logs(cursor, email, emotion_filter, date_filter)
+            + count_archived_logs(archive_cursor(), email, emotion_filter, date_filter))
+
+# 统计日志表（未归档部分）中符合条件的日志数
+def count_hot_logs(cursor, email, emotion_filter=None, date_filter=None):
+    count_query = "SELECT COUNT(*) as count FROM logs WHERE email = ?"
+    count_params = [email]
+    
+    if emotion_filter:
+        count_query += " AND emotion = ?"
+        count_params.append(emotion_filter)
+    
+    if date_filter:
+        clause, clause_params = day_filter(date_filter)
+        count_query += clause
+        count_params.extend(clause_params)
+    
+    cursor.execute(count_query, count_params)
+    return cursor.fetchone()[0]  # 使用索引访问而不是字典访问，因为没有设置row_factory
+
+# 校验IANA时区名称（如 Asia/Taipei），无效时返回None
+def normalize_timezone(name):
+    if not name or not isinstance(name, str):
+        return None
+    try:
+        ZoneInfo(name)
+        return name
+    except Exception:
+        return None
+
+# 用户时区的当前时间；没有设置时区时使用服务器本地时间
+def user_now(timezone=None):
+    if timezone:
+        return datetime.now(ZoneInfo(timezone))
+    return datetime.now()
+
+# 用户时区的今天（日志的day和连续打卡都按这个日期）；now为服务器本地时间，省略时取当前时间
+def user_today(timezone=None, now=None):
+    if now is None:
+        return user_now(timezone).date()
+    return (now.astimezone(ZoneInfo(timezone)) if timezone else now).date()
+
+# 取得用户时区: 令牌中带有时区时直接使用，否则按email查询
+def get_user_timezone(cursor, identity):
+    if 'timezone' not in identity:
+        cursor.execute('SELECT timezone FROM users WHERE email = ?', (identity['email'],))
+        row = cursor.fetchone()
+        identity['timezone'] = normalize_timezone(row[0]) if row else None
+    return identity['timezone']
+
+# 记录一次完成打卡: 同一天不重复计数，与上次完成日相邻则连续天数加一，否则重新计为1；
+# 在一条UPSERT语句中完成，并发写入也不会丢失更新
+def record_streak(cursor, email, day):
+    today = day.isoformat()
+    yesterday = (day - timedelta(days=1)).isoformat()
+    cursor.execute('''
+        INSERT INTO user_streaks (email, current_streak, longest_streak, last_day) VALUES (?, 1, 1, ?)
+        ON CONFLICT (email) DO UPDATE SET
+            current_streak = CASE
+                WHEN last_day >= excluded.last_day THEN current_streak
+                WHEN last_day = ? THEN current_streak + 1
+                ELSE 1 END,
+            longest_streak = MAX(longest_streak, CASE
+                WHEN last_day >= excluded.last_day THEN current_streak
+                WHEN last_day = ? THEN current_streak + 1
+                ELSE 1 END),
+            last_day = MAX(last_day, excluded.last_day)
+    ''', (email, today, yesterday, yesterday))
+
+# 读取连续打卡天数: 今天（用户时区）没有完成时当前连续天数为0
+def load_streak(cursor, email, today):
+    cursor.execute('SELECT current_streak, longest_streak, last_day FROM user_streaks WHERE email = ?', (email,))
+    row = cursor.fetchone()
+    if not row:
+        return 0, 0
+    current, longest, last_day = row
+    return (current if last_day == today.isoformat() else 0), longest
+
+# 汇总某段时间的统计: 全部时间直接读取用户汇总行；其他时间段完整的天累加日汇总表，
+# 起点所在的那天只有一部分在范围内，从日志表补足
+def load_period_stats(cursor, email, since=None):
+    if since is None:
+        cursor.execute(f"SELECT {', '.join(DAILY_STATS_COLUMNS)} FROM user_stats_totals WHERE email = ?", (email,))
+        row = cursor.fetchone() or (0,) * len(DAILY_STATS_COLUMNS)
+        return dict(zip(DAILY_STATS_COLUMNS, row))
+
+    sums = ', '.join(f"SUM({col})" for col in DAILY_STATS_COLUMNS)
+
+    start_day = since.date().isoformat()
+    cursor.execute(f"SELECT {sums} FROM daily_user_stats WHERE email = ? AND day > ?", (email, start_day))
+    totals = cursor.fetchone()
+    partial_sums = ', '.join(f"SUM({term})" for term in _daily_stats_terms('logs'))
+    cursor.execute(f"SELECT {partial_sums} FROM logs WHERE email = ? AND day = ? AND ts >= ?",
+                   (email, start_day, int(since.timestamp())))
+    partial = cursor.fetchone()
+    return {col: (a or 0) + (b or 0) for col, a, b in zip(DAILY_STATS_COLUMNS, totals, partial)}
+
+# 归档块中每行日志的列
+ARCHIVE_COLUMNS = ('log_id', 'user_id', 'email', 'time', 'ts', 'day', 'emotion', 'task', 'nft',
+                   'completed', 'transition_from', 'transition_to')
+
+def _decode_archive_block(data):
+    return json.loads(zlib.decompress(data))
+
+# 按月从新到旧解压该用户的归档块，逐行返回符合条件的日志（按 (ts, time, log_id) 降序）；
+# before为 (ts, time, log_id) 时只返回更早的日志，日期过滤时只解压日期范围内的月份
+def iter_archived_logs(cursor, email, emotion_filter=None, date_filter=None, before=None):
+    query = 'SELECT data FROM log_archive WHERE email = ?'
+    params = [email]
+    if before:
+        query += ' AND min_ts <= ?'
+        params.append(before[0])
+    if date_filter:
+        if len(date_filter) >= 7:
+            query += ' AND month = ?'
+            params.append(date_filter[:7])
+        else:
+            query += ' AND month >= ? AND month < ?'
+            params.extend([date_filter, date_filter + '~'])
+    query += ' ORDER BY month DESC'
+    cursor.execute(query, params)
+
+    ts_i, time_i, log_id_i = (ARCHIVE_COLUMNS.index(col) for col in ('ts', 'time', 'log_id'))
+    emotion_i, day_i = ARCHIVE_COLUMNS.index('emotion'), ARCHIVE_COLUMNS.index('day')
+    for (data,) in cursor.fetchall():
+        for row in reversed(_decode_archive_block(data)):
+            if before and (row[ts_i], row[time_i], row[log_id_i]) >= tuple(before):
+                continue
+            if emotion_filter and row[emotion_i] != emotion_filter:
+                continue
+            if date_filter:
+                day = row[day_i] or ''
+                if day != date_filter if len(date_filter) == 10 else not day.startswith(date_filter):
+                    continue
+            yield row
+
+# 从归档中读取一页日志: 只解压到取满为止，skip为需要跳过的条数。返回行的格式与get_logs的查询结果相同
+def load_archived_logs(cursor, email, emotion_filter=None, date_filter=None, before=None, skip=0, limit=50):
+    rows = []
+    for row in iter_archived_logs(cursor, email, emotion_filter, date_filter, before):
+        if skip:
+            skip -= 1
+            continue
+        log = dict(zip(ARCHIVE_COLUMNS, row))
+        rows.append((log['log_id'], log['time'], log['emotion'], log['task'], log['nft'],
+                     log['completed'], log['ts']))
+        if len(rows) >= limit:
+            break
+    return rows
+
+# 统计归档中符合条件的日志数: 没有过滤条件时直接累加各块的行数，否则解压日期范围内的块逐行过滤
+def count_archived_logs(cursor, email, emotion_filter=None, date_filter=None):
+    if not emotion_filter and not date_filter:
+        cursor.execute('SELECT COALESCE(SUM(count), 0) FROM log_archive WHERE email = ?', (email,))
+        return cursor.fetchone()[0]
+    return sum(1 for _ in iter_archived_logs(cursor, email, emotion_filter, date_filter))
+
+# 归档一个用户早于cutoff_ts的日志: 先按月合并进归档块并提交，再从日志表删除并提交（删除时暂停计数器触发器，
+# 总数和统计保持不变）；中途失败时重新执行，合并按log_id去重，不会产生重复
+def archive_user_logs(conn, email, cutoff_ts):
+    columns = ', '.join(ARCHIVE_COLUMNS)
+    rows = conn.execute(f'SELECT {columns} FROM logs WHERE email = ? AND ts < ? ORDER BY ts, time, log_id',
+                        (email, cutoff_ts)).fetchall()
+    if not rows:
+        return 0
+    ts_i, time_i, day_i = (ARCHIVE_COLUMNS.index(col) for col in ('ts', 'time', 'day'))
+    months = {}
+    for row in rows:
+        months.setdefault((row[day_i] or '')[:7], []).append(list(row))
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for month, month_rows in months.items():
+            existing = conn.execute('SELECT data FROM archive.log_archive WHERE email = ? AND month = ?',
+                                    (email, month)).fetchone()
+            merged = {row[0]: row for row in (_decode_archive_block(existing[0]) if existing else [])}
+            merged.update((row[0], row) for row in month_rows)
+            block = sorted(merged.values(), key=lambda row: (row[ts_i], row[time_i], row[0]))
+            conn.execute('''
+                INSERT OR REPLACE INTO archive.log_archive (email, month, user_id, min_ts, max_ts, count, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (email, month, block[-1][1], block[0][ts_i], block[-1][ts_i], len(block),
+                  zlib.compress(json.dumps(block, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('INSERT INTO log_triggers_paused (paused) VALUES (1)')
+        conn.executemany('DELETE FROM logs WHERE log_id = ?', [(row[0],) for row in rows])
+        conn.execute('DELETE FROM log_triggers_paused')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return len(rows)
+
+# 归档一个数据库中所有用户早于cutoff_ts的日志，每个用户单独提交，写锁只占用很短时间
+def archive_logs(path, cutoff_ts):
+    init_archive_db(archive_path(path))
+    conn = connect_db(path, isolation_level=None)
+    archived = 0
+    try:
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_path(path),))
+        conn.execute('PRAGMA archive.journal_mode=WAL')
+        emails = [row[0] for row in conn.execute(
+            'SELECT DISTINCT email FROM logs WHERE email IS NOT NULL').fetchall()]
+        for email in emails:
+            archived += archive_user_logs(conn, email, cutoff_ts)
+    finally:
+        conn.close()
+    return archived
+
+archive_stats = {'last_run': None, 'last_archived': 0, 'total_archived': 0}
+
+# 归档所有数据库中超过保留天数的日志
+def run_archive(days=None):
+    days = max(days or ARCHIVE_AFTER_DAYS, ARCHIVE_MIN_DAYS)
+    cutoff_ts = int((datetime.now() - timedelta(days=days)).timestamp())
+    archived = 0
+    for path in data_db_paths():
+        try:
+            archived += archive_logs(path, cutoff_ts)
+        except Exception as e:
+            logger.error(f"日誌歸檔失敗: {path}, {e}")
+    archive_stats['last_run'] = datetime.now().isoformat()
+    archive_stats['last_archived'] = archived
+    archive_stats['total_archived'] += archived
+    logger.info(f"日誌歸檔完成: 歸檔{archived}條，保留最近{days}天")
+    return archived
+
+# 日志分页游标: 对客户端不透明，内容是上一页最后一条的 (ts, time, log_id)
+def encode_log_cursor(ts, time_text, log_id):
+    return _b64encode(json.dumps([ts, time_text, log_id], separators=(',', ':')).encode('utf-8'))
+
+# 解析分页游标，格式不正确时返回None
+def decode_log_cursor(value):
+    try:
+        ts, time_text, log_id = json.loads(_b64decode(value))
+        if isinstance(ts, int) and isinstance(time_text, str) and isinstance(log_id, str):
+            return ts, time_text, log_id
+    except Exception:
+        pass
+    return None
+
+# 读取令牌签名密钥文件，不存在时生成: 先写入临时文件再用硬链接发布，
+# 多个进程同时启动时只有一个能创建成功，其余读取同一个密钥
+def load_token_secret(path):
+    try:
+        with open(path, 'rb') as f:
+            return bytes.fromhex(f.read().decode('ascii').strip())
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.urandom(32).hex())
+        try:
+            os.link(tmp_path, path)
+            logger.info(f"已生成會話令牌簽名密鑰: {path}")
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return bytes.fromhex(f.read().decode('ascii').strip())
+
+_token_secret = None
+
+def get_token_secret():
+    global _token_secret
+    if _token_secret is None:
+        _token_secret = TOKEN_SECRET or load_token_secret(TOKEN_SECRET_FILE)
+    return _token_secret
+
+def _sign(payload):
+    return _b64encode(hmac.new(get_token_secret(), payload.encode('ascii'), hashlib.sha256).digest())
+
+# 签发会话令牌: 携带user_id、email、时区和过期时间，用HMAC-SHA256签名
+def issue_token(user_id, email, timezone=None):
+    body = json.dumps({'uid': str(user_id), 'email': email, 'tz': timezone,
+                       'exp': int(time.time()) + TOKEN_TTL},
+                      separators=(',', ':'))
+    payload = _b64encode(body.encode('utf-8'))
+    return f"{payload}.{_sign(payload)}"
+
+# 校验会话令牌: 签名正确且未过期时返回内容，否则返回None
+def verify_token(token):
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        data = json.loads(_b64decode(payload))
+        if data.get('exp', 0) < time.time():
+            return None
+        return data
+    except Exception:
+        return None
+
+# 识别当前用户: 优先使用 Authorization: Bearer 令牌（无需查询users表），
+# 没有令牌时回退到请求中的email，此时user_id为None，需要时由调用方查询
+# 返回 (identity, error_response)
+def get_identity(email=None):
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        data = verify_token(auth[7:].strip())
+        if not data:
+            return None, (jsonify({
+                'success': False,
+                'message': '登錄已過期，請重新登錄'
+            }), 401)
+        return {'user_id': data['uid'], 'email': data['email'],
+                'timezone': normalize_timezone(data.get('tz'))}, None
+
+    if not email or not is_valid_email(email):
+        return None, (jsonify({
+            'success': False,
+            'message': '無效的用戶信息'
+        }), 401)
+    return {'user_id': None, 'email': email}, None
+
+# 读取用户的上次情绪: 以数据库为准（多个工作进程共用），只有本进程尚未提交的写入才使用待写入的值；
+# 已知user_id时直接按主键查询，不知道时用一次联表查询同时取得user_id；不在用户表中的用户只有内存中的值
+def load_last_emotion(cursor, identity):
+    if identity['user_id']:
+        with pending_last_emotions_lock:
+            pending = pending_last_emotions.get(identity['user_id'])
+        if pending:
+            return pending[0]
+        cursor.execute('SELECT last_emotion FROM user_emotions WHERE user_id = ?', (identity['user_id'],))
+        result = cursor.fetchone()
+        prev_emotion = result[0] if result else None
+    else:
+        cursor.execute('''
+            SELECT u.user_id, ue.last_emotion
+            FROM users u
+            LEFT JOIN user_emotions ue ON ue.user_id = u.user_id
+            WHERE u.email = ?
+        ''', (identity['email'],))
+        result = cursor.fetchone()
+        if not result:
+            return user_last_emotion.get(identity['email'])
+        identity['user_id'] = result[0]
+        with pending_last_emotions_lock:
+            pending = pending_last_emotions.get(result[0])
+        prev_emotion = pending[0] if pending else result[1]
+    return prev_emotion
+
 # API: 註冊
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -291,6 +2097,7 @@ def register():
         password = data.get('password')
         user_name = data.get('user_name')
         confirm_password = data.get('confirm_password')  # 获取确认密码
+        timezone = normalize_timezone(data.get('timezone'))  # 用户时区，用于按当地日期计算连续打卡
         
         # 验证输入
         if not email or not password or not user_name:
@@ -334,21 +2141,21 @@ def register():
                 'message': '該電子郵件已被註冊'
             }), 409
         
-        # 密码加密
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # 密码加密（在密码哈希执行器中执行）
+        hashed_password = hash_password(password)
         user_id = str(uuid.uuid4())
         
         # 插入用户
         cursor.execute(
-            'INSERT INTO users (user_id, email, password, user_name, created_at) VALUES (?, ?, ?, ?, ?)',
-            (user_id, email, hashed_password.decode('utf-8'), user_name, datetime.now().isoformat())
+            'INSERT INTO users (user_id, email, password, user_name, created_at, timezone) VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, email, hashed_password, user_name, datetime.now().isoformat(), timezone)
         )
         conn.commit()
         
         # 更新内存中的用户数据
         users_db[email] = {
             'user_id': user_id,
-            'password': hashed_password.decode('utf-8'),
+            'password': hashed_password,
             'user_name': user_name
         }
         
@@ -358,9 +2165,13 @@ def register():
             'success': True,
             'user_id': user_id,
             'email': email,
-            'user_name': user_name
+            'user_name': user_name,
+            'token': issue_token(user_id, email, timezone)
         }), 201
         
+    except (ExecutorBusy, FutureTimeoutError):
+        logger.warning("密碼雜湊繁忙，拒絕註冊請求")
+        return busy_response('註冊請求過多，請稍後重試')
     except Exception as e:
         logger.error(f"註冊失敗: {e}")
         return jsonify({
@@ -375,6 +2186,7 @@ def login():
         data = request.json
         email = data.get('email')
         password = data.get('password')
+        timezone = normalize_timezone(data.get('timezone'))
         
         # 验证输入
         if not email or not password:
@@ -391,28 +2203,39 @@ def login():
                 'user_id': '1',
                 'email': email,
                 'user_name': '測試用戶',
+                'token': issue_token('1', email, timezone),
                 'message': '演示用戶登錄成功'
             })
         
         # 检查用户
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
+        cursor.execute('SELECT user_id, email, password, user_name, timezone FROM users WHERE email = ?', (email,))
+        row = cursor.fetchone()
         
-        if not user:
+        if not row:
             return jsonify({
                 'success': False,
                 'message': '電子郵件或密碼錯誤'
             }), 401
         
-        # 验证密码
+        user = {
+            'user_id': row[0],
+            'email': row[1],
+            'password': row[2],
+            'user_name': row[3],
+            'timezone': timezone or normalize_timezone(row[4])
+        }
+        
+        # 验证密码（在密码哈希执行器中执行）
         try:
-            if not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+            if not check_password(password, user['password']):
                 return jsonify({
                     'success': False,
                     'message': '電子郵件或密碼錯誤'
                 }), 401
+        except (ExecutorBusy, FutureTimeoutError):
+            raise
         except Exception as e:
             logger.error(f"密碼驗證失敗: {e}")
             return jsonify({
@@ -420,9 +2243,9 @@ def login():
                 'message': '密碼驗證失敗，請聯繫管理員'
             }), 500
         
-        # 更新最後登錄時間
-        cursor.execute('UPDATE users SET last_login = ? WHERE user_id = ?',
-                      (datetime.now().isoformat(), user['user_id']))
+        # 更新最後登錄時間和用戶時區
+        cursor.execute('UPDATE users SET last_login = ?, timezone = ? WHERE user_id = ?',
+                      (datetime.now().isoformat(), user['timezone'], user['user_id']))
         conn.commit()
         
         logger.info(f"用戶登錄成功: {email}, 用戶名稱: {user['user_name']}")
@@ -431,9 +2254,13 @@ def login():
             'success': True,
             'user_id': user['user_id'],
             'email': user['email'],
-            'user_name': user['user_name']
+            'user_name': user['user_name'],
+            'token': issue_token(user['user_id'], user['email'], user['timezone'])
         })
         
+    except (ExecutorBusy, FutureTimeoutError):
+        logger.warning("密碼雜湊繁忙，拒絕登錄請求")
+        return busy_response('登錄請求過多，請稍後重試')
     except Exception as e:
         logger.error(f"登錄失敗: {e}")
         return jsonify({
@@ -445,126 +2272,195 @@ def login():
 @app.route('/api/process-emotion', methods=['POST'])
 def process_emotion():
     try:
-        data = request.json
-        user_input = data.get('input', '')
-        email = data.get('email')
-        task_completed = data.get('task_completed', False)
+        # 整个请求使用同一版本的词库
+        lexicon = get_lexicon()
+        stream_info = None
+
+        if request.mimetype == 'text/plain':
+            # 长篇日记: 请求体为纯文本，用户信息放在查询参数中，读取到扫描上限后分块检测
+            task_completed = request.args.get('task_completed', '').lower() in ('1', 'true', 'yes')
+
+            identity, error = get_identity(request.args.get('email'))
+            if error:
+                return error
+
+            suggestion, stream_info = classify_stream(request.stream, lexicon)
+            user_input = stream_info.pop('preview')
+
+            if suggestion is None:
+                return jsonify({
+                    'success': False,
+                    'message': '情緒描述不能為空'
+                }), 400
+        else:
+            data = request.json
+
+            # 增强的输入类型验证和处理
+            # 确保data是字典
+            if not isinstance(data, dict):
+                data = {}
+
+            user_input = normalize_emotion_input(data.get('input', ''))
+            task_completed = data.get('task_completed', False)
+
+            # 验证输入
+            if not user_input:
+                return jsonify({
+                    'success': False,
+                    'message': '情緒描述不能為空'
+                }), 400
+
+            identity, error = get_identity(data.get('email'))
+            if error:
+                return error
+
+            # 偵測情緒並組裝建議
+            suggestion = classify_and_suggest(user_input, lexicon)
+
+        emotion = suggestion['emotion']
+        email = identity['email']
+
+        conn = get_user_db(identity)
+        cursor = conn.cursor()
+
+        # 获取上次情绪（带令牌时直接按user_id查询，不再查询users表）
+        prev_emotion = load_last_emotion(cursor, identity)
+
+        # 檢查情緒轉移
+        emotion_result = apply_transition(suggestion, prev_emotion, task_completed)
+
+        # 更新内存中的上次情绪
+        user_last_emotion[email] = emotion
+        
+        # 更新数据库中的上次情绪（交给写入队列，不等待提交）
+        if identity['user_id']:
+            save_last_emotion(identity['user_id'], emotion)
         
-        # 增强的输入类型验证和处理
+        logger.info(f"處理情緒成功: 用戶={email}, 輸入='{user_input[:30]}...', 檢測情緒={emotion}")
+        
+        response = {
+            'success': True,
+            **emotion_result
+        }
+        if stream_info is not None:
+            response.update(stream_info)
+
+        return jsonify(response)
+
+    except ExecutorBusy:
+        logger.warning("情緒分類繁忙，拒絕請求")
+        return busy_response('系統繁忙，請稍後重試')
+    except FutureTimeoutError:
+        logger.error("情緒分類超時")
+        return jsonify({
+            'success': False,
+            'message': '處理情緒超時，請稍後重試'
+        }), 504
+    except Exception as e:
+        logger.error(f"處理情緒失敗: {e}")
+        return jsonify({
+            'success': False,
+            'message': '處理情緒失敗，請稍後重試'
+        }), 500
+
+# API: 批量處理情緒輸入（同一用戶，按順序返回結果）
+@app.route('/api/process-emotion-batch', methods=['POST'])
+def process_emotion_batch():
+    try:
+        data = request.json
+
         # 确保data是字典
         if not isinstance(data, dict):
             data = {}
-        
-        # 重新获取user_input，确保正确的变量引用
-        user_input = data.get('input', '')
-        
-        # 确保user_input是字符串 - 全面的类型处理
-        if user_input is None:
-            user_input = ''
-        elif not isinstance(user_input, str):
-            # 如果是字典，尝试各种方式提取字符串内容
-            if isinstance(user_input, dict):
-                # 1. 尝试获取text字段
-                if 'text' in user_input:
-                    user_input = user_input['text']
-                # 2. 尝试获取第一个非空值
-                elif user_input:
-                    for key, value in user_input.items():
-                        if isinstance(value, str) and value.strip():
-                            user_input = value
-                            break
-                    # 如果没有找到合适的值，使用第一个值
-                    else:
-                        first_value = next(iter(user_input.values()), '')
-                        user_input = str(first_value)
-                else:
-                    user_input = ''
-            # 对于其他非字符串类型，转换为字符串
-            else:
-                try:
-                    user_input = str(user_input)
-                except:
-                    user_input = ''
-        
-        # 去除首尾空白字符
-        user_input = user_input.strip()
-        
+
+        inputs = data.get('inputs')
+        default_completed = data.get('task_completed', False)
+
         # 验证输入
-        if not user_input:
+        if not isinstance(inputs, list) or not inputs:
             return jsonify({
                 'success': False,
-                'message': '情緒描述不能為空'
+                'message': '情緒描述列表不能為空'
             }), 400
-        
-        if not email or not is_valid_email(email):
+
+        if len(inputs) > MAX_BATCH_SIZE:
             return jsonify({
                 'success': False,
-                'message': '無效的用戶信息'
-            }), 401
-        
-        # 偵測情緒
-        emotion = detect_emotion(user_input)
-        pkg = SUGGESTIONS.get(emotion, SUGGESTIONS['neutral'])
-        
-        # 生成基本NFT
-        nft = generate_nft_badge(emotion)
-        
-        # 檢查情緒轉移
-        transition_nft_str = ''
-        conn = get_db()
+                'message': f'單次最多處理{MAX_BATCH_SIZE}條情緒描述'
+            }), 400
+
+        identity, error = get_identity(data.get('email'))
+        if error:
+            return error
+        email = identity['email']
+
+        conn = get_user_db(identity)
         cursor = conn.cursor()
-        
-        # 从数据库获取上次情绪
-        cursor.execute('SELECT last_emotion FROM user_emotions WHERE user_id = (SELECT user_id FROM users WHERE email = ?)', (email,))
-        result = cursor.fetchone()
-        prev_emotion = result[0] if result else None
-        
-        # 或者从内存中获取
-        if not prev_emotion and email in user_last_emotion:
-            prev_emotion = user_last_emotion[email]
-        
-        if prev_emotion and task_completed:
-            transition_nft = generate_transition_nft(prev_emotion, emotion)
-            if transition_nft:
-                transition_nft_str = ' + ' + transition_nft
-                nft += transition_nft_str
-        
-        # 更新数据库中的上次情绪
-        user_id = None
-        cursor.execute('SELECT user_id FROM users WHERE email = ?', (email,))
-        user_result = cursor.fetchone()
-        if user_result:
-            user_id = user_result[0]
-            cursor.execute(
-                'INSERT OR REPLACE INTO user_emotions (user_id, last_emotion, last_update) VALUES (?, ?, ?)',
-                (user_id, emotion, datetime.now().isoformat())
-            )
-            conn.commit()
-        
-        # 更新内存中的上次情绪
-        user_last_emotion[email] = emotion
-        
-        logger.info(f"處理情緒成功: 用戶={email}, 輸入='{user_input[:30]}...', 檢測情緒={emotion}")
-        
+
+        # 获取上次情绪（带令牌时直接按user_id查询）
+        prev_emotion = load_last_emotion(cursor, identity)
+        user_id = identity['user_id']
+
+        # 整理输入，空的条目单独标记
+        entries = []
+        for item in inputs:
+            task_completed = default_completed
+            if isinstance(item, dict) and 'input' in item:
+                task_completed = item.get('task_completed', default_completed)
+                item = item['input']
+            entries.append((normalize_emotion_input(item), task_completed))
+
+        # 非空条目一次性交给进程池检测
+        lexicon = get_lexicon()
+        texts = [text for text, _ in entries if text]
+        suggestions = iter(classify_and_suggest_batch(texts, lexicon) if texts else [])
+
+        # 按顺序处理，每一条的上次情绪就是前一条的检测结果
+        results = []
+        for user_input, task_completed in entries:
+            if not user_input:
+                results.append({
+                    'success': False,
+                    'message': '情緒描述不能為空'
+                })
+                continue
+
+            suggestion = apply_transition(next(suggestions), prev_emotion, task_completed)
+            results.append({
+                'success': True,
+                **suggestion
+            })
+            prev_emotion = suggestion['emotion']
+
+        # 只需在一个事务中写入最后一次情绪
+        last_emotion = next((r['emotion'] for r in reversed(results) if r['success']), None)
+        if last_emotion:
+            user_last_emotion[email] = last_emotion
+            if user_id:
+                save_last_emotion(user_id, last_emotion)
+
+        logger.info(f"批量處理情緒成功: 用戶={email}, 條數={len(results)}")
+
         return jsonify({
             'success': True,
-            'emotion': emotion,
-            'package': {
-                'tips': pkg['tips'],
-                'daily_task': pkg['daily_task'],
-                'advice': pkg['advice'],
-                'resources': pkg['resources'],
-                'color': pkg['color']
-            },
-            'nft': nft,
-            'transition_nft': transition_nft_str
+            'results': results,
+            'lexicon_version': lexicon.version
         })
-        
+
+    except ExecutorBusy:
+        logger.warning("情緒分類繁忙，拒絕批量請求")
+        return busy_response('系統繁忙，請稍後重試')
+    except FutureTimeoutError:
+        logger.error("批量情緒分類超時")
+        return jsonify({
+            'success': False,
+            'message': '批量處理情緒超時，請稍後重試'
+        }), 504
     except Exception as e:
-        logger.error(f"處理情緒失敗: {e}")
+        logger.error(f"批量處理情緒失敗: {e}")
         return jsonify({
             'success': False,
-            'message': '處理情緒失敗，請稍後重試'
+            'message': '批量處理情緒失敗，請稍後重試'
         }), 500
 
 # API: 記錄日誌
@@ -572,50 +2468,53 @@ def process_emotion():
 def add_log():
     try:
         data = request.json
-        email = data.get('email')
         emotion = data.get('emotion')
         task = data.get('task')
         badge = data.get('nft')  # 从UI传过来的是nft
         completed = data.get('completed', False)
+        transition_from, transition_to = resolve_transition(
+            emotion, badge, data.get('transition_from'), data.get('transition_to'))
         
         # 验证输入
-        if not all([email, emotion, task, badge]):
+        if not all([emotion, task, badge]):
             return jsonify({
                 'success': False,
                 'message': '缺少必要的日誌信息'
             }), 400
         
-        if not is_valid_email(email):
-            return jsonify({
-                'success': False,
-                'message': '無效的用戶信息'
-            }), 401
+        identity, error = get_identity(data.get('email'))
+        if error:
+            return error
+        email = identity['email']
         
         # 生成日誌ID和時間戳
         log_id = str(uuid.uuid4())
-        timestamp = datetime.now().isoformat()
+        now = datetime.now()
+        timestamp = now.isoformat()
         
         # 保存到数据库
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM users WHERE email = ?', (email,))
-        user_result = cursor.fetchone()
+        user_id = identity['user_id']
         
-        if not user_result:
-            return jsonify({
-                'success': False,
-                'message': '用戶不存在'
-            }), 404
+        # 没有令牌时才需要按email查询user_id
+        if not user_id:
+            if not resolve_user(cursor, identity):
+                return jsonify({
+                    'success': False,
+                    'message': '用戶不存在'
+                }), 404
+            
+            user_id = identity['user_id']
         
-        user_id = user_result[0]
+        # 日志的日期按用户时区计算，与连续打卡使用同一天；完成任务时更新连续打卡状态，与日志在同一事务中提交
+        today = user_today(get_user_timezone(cursor, identity), now)
+        streak_day = today if completed else None
         
-        cursor.execute(
-            '''INSERT INTO logs 
-               (log_id, user_id, email, time, emotion, task, nft, completed) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (log_id, user_id, email, timestamp, emotion, task, badge, completed)
-        )
-        conn.commit()
+        # 交给写入队列组提交，等待提交完成后再返回
+        run_write(write_log, (log_id, user_id, email, timestamp, int(now.timestamp()), today.isoformat(),
+                              emotion, task, badge, completed, transition_from, transition_to), streak_day,
+                  user_id=user_id)
         
         # 更新内存中的日志（用于缓存）
         log_entry = {
@@ -640,6 +2539,15 @@ def add_log():
             'log': log_entry
         })
         
+    except ExecutorBusy:
+        logger.warning("寫入隊列已滿，拒絕記錄日誌")
+        return busy_response('系統繁忙，請稍後重試')
+    except FutureTimeoutError:
+        logger.error("記錄日誌超時")
+        return jsonify({
+            'success': False,
+            'message': '記錄日誌超時，請稍後重試'
+        }), 504
     except Exception as e:
         logger.error(f"記錄日誌失敗: {e}")
         return jsonify({
@@ -651,25 +2559,38 @@ def add_log():
 @app.route('/api/get-logs', methods=['GET'])
 def get_logs():
     try:
-        email = request.args.get('email')
         emotion_filter = request.args.get('emotion')
         date_filter = request.args.get('date')
         limit = request.args.get('limit', default=50, type=int)
         offset = request.args.get('offset', default=0, type=int)
+        page_cursor = request.args.get('cursor')
+        include_total = request.args.get('include_total', 'true').lower() not in ('0', 'false', 'no')
         
         # 验证输入
-        if not email or not is_valid_email(email):
-            return jsonify({
-                'success': False,
-                'message': '無效的用戶信息'
-            }), 401
+        identity, error = get_identity(request.args.get('email'))
+        if error:
+            return error
+        email = identity['email']
+        
+        seek = None
+        if page_cursor:
+            seek = decode_log_cursor(page_cursor)
+            if seek is None:
+                return jsonify({
+                    'success': False,
+                    'message': '無效的分頁遊標'
+                }), 400
         
-        # 构建查詢
-        conn = get_db()
+        # 构建查詢（启用分片时只访问该用户的分片）
+        conn = get_user_db(identity)
         cursor = conn.cursor()
         
+        # 归档库连接只在需要读取归档时才取得，大多数请求只访问日志表和计数器
+        def archive_cursor():
+            return get_archive_db(identity).cursor()
+        
         # 基礎查詢
-        query = '''SELECT log_id, time, emotion, task, nft, completed 
+        query = '''SELECT log_id, time, emotion, task, nft, completed, ts 
                   FROM logs 
                   WHERE email = ?''' 
         params = [email]
@@ -680,17 +2601,35 @@ def get_logs():
             params.append(emotion_filter)
         
         if date_filter:
-            query += " AND time LIKE ?"
-            params.append(f"{date_filter}%")
-        
-        # 添加排序和分页
-        query += " ORDER BY time DESC LIMIT ? OFFSET ?"
+            clause, clause_params = day_filter(date_filter)
+            query += clause
+            params.extend(clause_params)
+        
+        # 添加排序和分页: 有游标时从上一页最后一条之后按索引定位，否则兼容旧的offset分页
+        if seek:
+            query += " AND (ts, time, log_id) < (?, ?, ?)"
+            params.extend(seek)
+            offset = 0
+        query += " ORDER BY ts DESC, time DESC, log_id DESC LIMIT ? OFFSET ?"
         params.extend([limit, offset])
         
         # 执行查询
         cursor.execute(query, params)
+        rows = cursor.fetchall()
+        
+        # 热数据不足一页时从归档中补足: 接在本页最后一条之后，或者按游标/offset定位到归档中
+        if len(rows) < limit:
+            if rows:
+                before, skip = (rows[-1][6], rows[-1][1], rows[-1][0]), 0
+            else:
+                before = seek
+                skip = offset - count_hot_logs(cursor, email, emotion_filter, date_filter) if offset else 0
+            if skip >= 0:
+                rows += load_archived_logs(archive_cursor(), email, emotion_filter, date_filter,
+                                           before, skip, limit - len(rows))
+        
         logs = []
-        for row in cursor.fetchall():
+        for row in rows:
             log = {
                 'log_id': row[0],
                 'time': row[1],
@@ -701,20 +2640,13 @@ def get_logs():
             }
             logs.append(log)
         
-        # 获取总数
-        count_query = "SELECT COUNT(*) as count FROM logs WHERE email = ?"
-        count_params = [email]
-        
-        if emotion_filter:
-            count_query += " AND emotion = ?"
-            count_params.append(emotion_filter)
-        
-        if date_filter:
-            count_query += " AND time LIKE ?"
-            count_params.append(f"{date_filter}%")
+        # 获取总数（include_total=false时跳过）
+        total = count_logs(cursor, archive_cursor, email, emotion_filter, date_filter) if include_total else None
         
-        cursor.execute(count_query, count_params)
-        total = cursor.fetchone()[0]  # 使用索引访问而不是字典访问，因为没有设置row_factory
+        # 本页已满时返回下一页的游标
+        next_cursor = None
+        if rows and len(rows) == limit and rows[-1][6] is not None:
+            next_cursor = encode_log_cursor(rows[-1][6], rows[-1][1], rows[-1][0])
         
         logger.info(f"查詢日誌成功: 用戶={email}, 數量={len(logs)}, 總數={total}")
         
@@ -723,7 +2655,8 @@ def get_logs():
             'logs': logs,
             'total': total,
             'limit': limit,
-            'offset': offset
+            'offset': offset,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -733,103 +2666,178 @@ def get_logs():
             'message': '查詢日誌失敗，請稍後重試'
         }), 500
 
+# 导出的日志列和各格式的Content-Type
+EXPORT_COLUMNS = ('log_id', 'time', 'emotion', 'task', 'nft', 'completed', 'transition_from', 'transition_to')
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# NDJSON导出中途失败时写在最后的错误记录（没有log_id），客户端据此判断导出不完整
+EXPORT_ERROR_RECORD = {'success': False, 'message': '導出中斷，日誌不完整，請重新導出'}
+
+# 按时间从早到晚逐条读取用户的全部日志（先归档块，再日志表）: 归档每次只解压一个月的块，
+# 日志表按 (ts, time, log_id) 分批定位读取；每批单独取出和归还连接，不持有长时间的读事务
+def iter_user_logs(email, shard=None):
+    archive_pool = archive_pools[shard or 0]
+    month = ''
+    while True:
+        conn = archive_pool.acquire()
+        try:
+            row = conn.execute('SELECT month, data FROM log_archive WHERE email = ? AND month > ? ORDER BY month LIMIT 1',
+                               (email, month)).fetchone()
+        finally:
+            archive_pool.release(conn)
+        if row is None:
+            break
+        month = row[0]
+        for values in _decode_archive_block(row[1]):
+            log = dict(zip(ARCHIVE_COLUMNS, values))
+            yield tuple(log[col] for col in EXPORT_COLUMNS)
+
+    pool = db_pool if shard is None else shard_pools[shard]
+    columns = ', '.join(EXPORT_COLUMNS)
+    last = None
+    while True:
+        query = f'SELECT {columns}, ts FROM logs WHERE email = ? AND ts IS NOT NULL'
+        params = [email]
+        if last:
+            query += ' AND (ts, time, log_id) > (?, ?, ?)'
+            params.extend(last)
+        query += ' ORDER BY ts, time, log_id LIMIT ?'
+        params.append(EXPORT_BATCH_ROWS)
+        conn = pool.acquire()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            pool.release(conn)
+        for row in rows:
+            yield row[:-1]
+        if len(rows) < EXPORT_BATCH_ROWS:
+            break
+        last = (rows[-1][-1], rows[-1][1], rows[-1][0])
+
+def format_ndjson(rows):
+    for row in rows:
+        log = dict(zip(EXPORT_COLUMNS, row))
+        log['completed'] = bool(log['completed'])
+        yield json.dumps(log, ensure_ascii=False) + '\n'
+
+# CSV开头加BOM，Excel打开时中文不会乱码
+def format_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    # 表头总是先发送，没有日志时也是带表头的CSV
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row[:5] + (int(bool(row[5])),) + row[6:])
+        yield buffer.getvalue()
+
+# 把文本行编码后合并为固定大小的块，需要时用gzip流式压缩；内存占用与导出总量无关
+def encode_export(lines, compress=False):
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip格式
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b''.join(buffer)
+            buffer = []
+            size = 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+# API: 导出用户的全部日志（NDJSON或CSV，可选gzip），边查询边发送
+@app.route('/api/export-logs', methods=['GET'])
+def export_logs():
+    try:
+        export_format = request.args.get('format', 'ndjson').lower()
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'message': '不支持的導出格式'
+            }), 400
+        
+        identity, error = get_identity(request.args.get('email'))
+        if error:
+            return error
+        email = identity['email']
+        shard = user_shard(identity)
+        formatter = format_csv if export_format == 'csv' else format_ndjson
+        
+        # 响应已经开始发送后出错时不能再返回错误状态码: 未压缩的NDJSON在末尾写一条错误记录；
+        # CSV和gzip重新抛出异常，由服务器中断连接，客户端收到的是不完整的分块响应（gzip流也没有结尾），不会当作完整文件
+        def generate():
+            try:
+                yield from encode_export(formatter(iter_user_logs(email, shard)), compress)
+            except Exception as e:
+                logger.error(f"導出日誌中斷: 用戶={email}, 格式={export_format}, {e}")
+                if compress or export_format != 'ndjson':
+                    raise
+                yield (json.dumps(EXPORT_ERROR_RECORD, ensure_ascii=False) + '\n').encode('utf-8')
+                return
+            logger.info(f"導出日誌成功: 用戶={email}, 格式={export_format}")
+        
+        filename = f"moodmend_logs_{datetime.now().strftime('%Y%m%d')}.{export_format}" + ('.gz' if compress else '')
+        response = Response(generate(), mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+        
+    except Exception as e:
+        logger.error(f"導出日誌失敗: {e}")
+        return jsonify({
+            'success': False,
+            'message': '導出日誌失敗，請稍後重試'
+        }), 500
+
 # API: 获取统计数据
 @app.route('/api/get-stats', methods=['GET'])
 def get_stats():
     try:
-        email = request.args.get('email')
         period = request.args.get('period', 'all')  # all, week, month
         
         # 验证输入
-        if not email or not is_valid_email(email):
-            return jsonify({
-                'success': False,
-                'message': '無效的用戶信息'
-            }), 401
+        identity, error = get_identity(request.args.get('email'))
+        if error:
+            return error
+        email = identity['email']
         
-        conn = get_db()
+        conn = get_user_db(identity)
         cursor = conn.cursor()
+        timezone = get_user_timezone(cursor, identity)
         
-        # 构建時間過濾條件
-        time_filter = ""
-        params = [email]
-        
+        # 构建時間過濾條件（按用户时区，与日志的day一致）
+        since = None
         if period == 'week':
             # 过去7天
-            time_filter = " AND time >= ?"
-            week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-            params.append(week_ago)
+            since = user_now(timezone) - timedelta(days=7)
         elif period == 'month':
             # 过去30天
-            time_filter = " AND time >= ?"
-            month_ago = (datetime.now() - timedelta(days=30)).isoformat()
-            params.append(month_ago)
-        
-        # 查询总数和完成数
-        query = f"""
-            SELECT 
-                COUNT(*) as total, 
-                SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END) as completed
-            FROM logs 
-            WHERE email = ? {time_filter}
-        """
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        total = result[0] or 0
-        completed = result[1] or 0
-        
-        # 查询情绪转移数
-        transition_query = f"""
-            SELECT COUNT(*) as count 
-            FROM logs 
-            WHERE email = ? AND nft LIKE ? {time_filter}
-        """
-        cursor.execute(transition_query, params + ['%成功緩和%'])
-        transitions = cursor.fetchone()[0]
-        
-        # 查询情绪分布
-        emotion_query = f"""
-            SELECT emotion, COUNT(*) as count 
-            FROM logs 
-            WHERE email = ? {time_filter}
-            GROUP BY emotion
-        """
-        cursor.execute(emotion_query, params)
-        
-        chart_data = {
-            'anxious': 0,
-            'sad': 0,
-            'neutral': 0,
-            'happy': 0,
-            'angry': 0
-        }
+            since = user_now(timezone) - timedelta(days=30)
         
-        for row in cursor.fetchall():
-            if row[0] in chart_data:
-                chart_data[row[0]] = row[1]
+        # 从每日汇总表累加总数、完成数、情绪转移数和情绪分布
+        stats = load_period_stats(cursor, email, since)
+        total = stats['total']
+        completed = stats['completed']
+        transitions = stats['transitions']
+        chart_data = {emotion: stats[emotion] for emotion in STATS_EMOTIONS}
         
         # 计算完成率
         completion_rate = round((completed/total)*100) if total > 0 else 0
         
-        # 获取连续打卡天数
-        streak_query = f"""
-            SELECT DISTINCT date(time) as log_date 
-            FROM logs 
-            WHERE email = ? AND completed = 1 
-            ORDER BY log_date DESC
-        """
-        cursor.execute(streak_query, [email])
-        dates = [row[0] for row in cursor.fetchall()]
-        
-        streak = 0
-        current_date = datetime.now().date()
-        
-        for log_date_str in dates:
-            log_date = datetime.strptime(log_date_str, '%Y-%m-%d').date()
-            if (current_date - log_date).days == streak:
-                streak += 1
-            else:
-                break
+        # 获取连续打卡天数（单行查询，按用户时区判断今天）
+        streak, longest_streak = load_streak(cursor, email, user_today(timezone))
         
         logger.info(f"查詢統計數據成功: 用戶={email}, 完成率={completion_rate}%, 轉移次數={transitions}")
         
@@ -840,6 +2848,7 @@ def get_stats():
             'chart_data': chart_data,
             'total_logs': total,
             'streak': streak,
+            'longest_streak': longest_streak,
             'period': period
         })
         
@@ -869,11 +2878,16 @@ def load_users_from_db():
 # 從數據庫加載最近的日誌
 def load_recent_logs_from_db():
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        # 只加載最近100條日誌到內存
-        cursor.execute('SELECT log_id, time, email, emotion, task, nft, completed FROM logs ORDER BY time DESC LIMIT 100')
-        for row in cursor.fetchall():
+        rows = []
+        for path in data_db_paths():
+            conn = sqlite3.connect(path)
+            cursor = conn.cursor()
+            # 只加載最近100條日誌到內存（启用分片时合并各分片的最近日志）
+            cursor.execute('SELECT log_id, time, email, emotion, task, nft, completed, ts FROM logs ORDER BY ts DESC LIMIT 100')
+            rows.extend(cursor.fetchall())
+            conn.close()
+        rows.sort(key=lambda row: row[7] or 0, reverse=True)
+        for row in rows[:100]:
             log_entry = {
                 'log_id': row[0],
                 'time': row[1],
@@ -884,24 +2898,22 @@ def load_recent_logs_from_db():
                 'completed': row[6] == 1
             }
             logs_db.append(log_entry)
-        conn.close()
         logger.info(f"從數據庫加載日誌成功，共{len(logs_db)}條")
     except Exception as e:
         logger.error(f"加載日誌數據失敗: {e}")
 
-# 從數據庫加載用戶情緒數據
+# 從數據庫加載用戶情緒數據（启用分片时用户表和上次情绪不在同一个文件，按已加载的用户数据对应email）
 def load_user_emotions_from_db():
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT ue.user_id, u.email, ue.last_emotion 
-            FROM user_emotions ue 
-            JOIN users u ON ue.user_id = u.user_id
-        ''')
-        for row in cursor.fetchall():
-            user_last_emotion[row[1]] = row[2]
-        conn.close()
+        emails = {user['user_id']: email for email, user in users_db.items()}
+        for path in data_db_paths():
+            conn = sqlite3.connect(path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id, last_emotion FROM user_emotions')
+            for user_id, last_emotion in cursor.fetchall():
+                if user_id in emails:
+                    user_last_emotion[emails[user_id]] = last_emotion
+            conn.close()
         logger.info(f"從資料庫載入使用者情緒資料成功，共{len(user_last_emotion)}條")
     except Exception as e:
         logger.error(f"從數據庫加載用戶情緒資料失敗: {e}")
@@ -926,8 +2938,13 @@ def cleanup_memory_cache():
 # 應用上下文處理器
 @app.teardown_appcontext
 def close_db(error):
-    if 'db' in g:
-        g.db.close()
+    db = g.pop('db', None)
+    if db is not None:
+        db_pool.release(db)
+    for index, shard_db in g.pop('shard_dbs', {}).items():
+        shard_pools[index].release(shard_db)
+    for index, archive_db in g.pop('archive_dbs', {}).items():
+        archive_pools[index].release(archive_db)
 
 # 根路徑
 @app.route('/')
@@ -940,13 +2957,15 @@ def health_check():
     try:
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT 1')
-        conn.close()
+        cursor.execute('SELECT MAX(version) FROM schema_migrations')
+        schema_version = cursor.fetchone()[0]
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'version': 'V1.0.4'
+            'version': 'V1.0.4',
+            'schema_version': schema_version,
+            'lexicon_version': get_lexicon().version
         })
     except Exception as e:
         logger.error(f"健康檢查失敗: {e}")
@@ -955,22 +2974,171 @@ def health_check():
             'error': str(e)
         }), 500
 
-# 數據庫備份端點
+# 运行指标端点
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'timestamp': datetime.now().isoformat(),
+        'lexicon_version': get_lexicon().version,
+        'emotion_cache': emotion_cache.stats(),
+        'classify_pool': classify_pool.stats() if classify_pool else None,
+        'bcrypt_pool': bcrypt_pool.stats(),
+        'db_pool': db_pool.stats(),
+        'write_queue': write_queue.stats() if write_queue else None,
+        'shards': [{
+            'path': shard_path(i),
+            'db_pool': shard_pools[i].stats(),
+            'write_queue': shard_writers[i].stats() if shard_writers[i] else None
+        } for i in range(DB_SHARDS)],
+        'archive': dict(archive_stats, after_days=ARCHIVE_AFTER_DAYS or None)
+    })
+
+# 工具函数: 按块计算文件的SHA-256
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# 在线备份任务: 在后台线程中用SQLite备份API分步复制页面，每步之间休眠，避免占满I/O影响写入；
+# 复制期间在源库上保持一个读事务，WAL模式下写入不会被阻塞，其他连接的写入也不会让备份从头开始，
+# 得到的是备份开始时刻的一致快照。启用分片时主库和各分片依次备份
+class BackupJob:
+    def __init__(self, job_id, sources):
+        self.job_id = job_id
+        self.sources = sources  # [(源数据库, 备份文件)]
+        self.status = 'running'
+        self.files = []
+        self.current = None
+        self.pages_done = 0
+        self.pages_total = 0
+        self.error = None
+        self.started_at = datetime.now().isoformat()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        try:
+            for source, target in self.sources:
+                with self._lock:
+                    self.current = source
+                    self.pages_done = self.pages_total = 0
+                result = self._backup_file(source, target)
+                with self._lock:
+                    self.files.append(result)
+            status, error = 'completed', None
+            logger.info(f"數據庫備份成功: {', '.join(f['backup_file'] for f in self.files)}")
+        except Exception as e:
+            logger.error(f"數據庫備份失敗: {e}")
+            status, error = 'failed', str(e)
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.current = None
+            self.finished_at = datetime.now().isoformat()
+
+    # 先写入临时文件，复制完成后再改名，中途失败不会留下不完整的备份
+    def _backup_file(self, source, target):
+        partial = target + '.part'
+        src = connect_db(source, isolation_level=None)
+        dst = sqlite3.connect(partial)
+        try:
+            src.execute('BEGIN')
+            src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=self._progress)
+            src.execute('COMMIT')
+            # 备份文件改回回滚日志模式，单个文件即可完整恢复
+            dst.execute('PRAGMA journal_mode=DELETE')
+        except Exception:
+            dst.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            src.close()
+        dst.close()
+        os.replace(partial, target)
+        return {
+            'source': source,
+            'backup_file': target,
+            'size': os.path.getsize(target),
+            'sha256': file_sha256(target)
+        }
+
+    # 每复制一步后记录进度并休眠
+    def _progress(self, status, remaining, total):
+        with self._lock:
+            self.pages_total = total
+            self.pages_done = total - remaining
+        if BACKUP_STEP_SLEEP_MS > 0:
+            time.sleep(BACKUP_STEP_SLEEP_MS / 1000)
+
+    def to_dict(self):
+        with self._lock:
+            done = len(self.files)
+            if self.current and self.pages_total:
+                done += self.pages_done / self.pages_total
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'progress': round(done * 100 / len(self.sources), 1),
+                'current': {
+                    'source': self.current,
+                    'pages_done': self.pages_done,
+                    'pages_total': self.pages_total
+                } if self.current else None,
+                'files': list(self.files),
+                'error': self.error,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+backup_jobs = OrderedDict()
+backup_lock = threading.Lock()
+
+# 启动备份任务，同一时间只运行一个；已有任务在运行时返回 (该任务, False)
+def start_backup():
+    with backup_lock:
+        running = next((job for job in backup_jobs.values() if job.status == 'running'), None)
+        if running:
+            return running, False
+        job_id = uuid.uuid4().hex[:8]
+        prefix = os.path.join(BACKUP_DIR, f'moodmend_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}_{job_id}')
+        sources = [(DB_NAME, f'{prefix}.db')]
+        sources += [(shard_path(i), f'{prefix}_shard_{i:02d}.db') for i in range(DB_SHARDS)]
+        # 归档库与对应的数据库一起备份
+        sources += [(archive_path(source), archive_path(target)) for source, target in list(sources)
+                    if source in data_db_paths() and os.path.exists(archive_path(source))]
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        job = BackupJob(job_id, sources)
+        backup_jobs[job_id] = job
+        # 只保留最近的任务记录（更早的任务都已结束）
+        while len(backup_jobs) > BACKUP_MAX_JOBS:
+            backup_jobs.popitem(last=False)
+    threading.Thread(target=job.run, name=f'db-backup-{job_id}', daemon=True).start()
+    return job, True
+
+# 數據庫備份端點: 在后台开始在线备份，立即返回任务编号，进度和结果通过状态端点查询
 @app.route('/api/backup-db', methods=['POST'])
 def backup_database():
     try:
-        # 簡單的數據庫備份邏輯
-        backup_file = f'moodmend_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-        import shutil
-        shutil.copy2(DB_NAME, backup_file)
+        job, started = start_backup()
+        if not started:
+            return jsonify({
+                'success': False,
+                'message': '已有備份正在進行',
+                'job': job.to_dict()
+            }), 409
         
-        logger.info(f"數據庫備份成功: {backup_file}")
+        logger.info(f"數據庫備份開始: 任務={job.job_id}")
         
         return jsonify({
             'success': True,
-            'message': '數據庫備份成功',
-            'backup_file': backup_file
-        })
+            'message': '數據庫備份已開始',
+            'job_id': job.job_id,
+            'job': job.to_dict()
+        }), 202
     except Exception as e:
         logger.error(f"數據庫備份失敗: {e}")
         return jsonify({
@@ -978,6 +3146,20 @@ def backup_database():
             'message': '數據庫備份失敗'
         }), 500
 
+# 數據庫備份狀態端點: 进度、完成后的文件大小和SHA-256
+@app.route('/api/backup-db/<job_id>', methods=['GET'])
+def backup_status(job_id):
+    job = backup_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': '備份任務不存在'
+        }), 404
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
 # 定时任务初始化
 import atexit
 from threading import Timer
@@ -989,25 +3171,61 @@ def schedule_cleanup():
     t.daemon = True
     t.start()
 
+def schedule_archive():
+    # 每天执行一次日志归档
+    run_archive()
+    t = Timer(ARCHIVE_INTERVAL, schedule_archive)
+    t.daemon = True
+    t.start()
+
+# 启动服务: 初始化数据库、加载数据、启动定时任务和词库监视（WSGI和ASGI模式共用）
+def start_services():
+    # 初始化数据库
+    init_db()
+    # 启动时读取（或生成）令牌签名密钥，密钥文件不可写时尽早报错
+    get_token_secret()
+    
+    # 加载数据
+    load_users_from_db()
+    load_recent_logs_from_db()
+    load_user_emotions_from_db()
+    
+    # 启动定时任务
+    schedule_cleanup()
+    if ARCHIVE_AFTER_DAYS > 0:
+        # 归档在后台线程中执行，不阻塞启动
+        t = Timer(0, schedule_archive)
+        t.daemon = True
+        t.start()
+    
+    # 监视词库文件，支持不重启热更新
+    start_lexicon_watcher()
+
+# 停止服务: 写完写入队列中剩余的操作，关闭执行器和数据库连接
+def stop_services():
+    cleanup_memory_cache()
+    if write_queue:
+        write_queue.close()
+    for writer in shard_writers:
+        if writer:
+            writer.close()
+    if classify_pool:
+        classify_pool.shutdown()
+    bcrypt_pool.shutdown()
+    db_pool.close_all()
+    for pool in shard_pools + archive_pools:
+        pool.close_all()
+
 if __name__ == '__main__':
     try:
-        # 初始化数据库
-        init_db()
-        
-        # 加载数据
-        load_users_from_db()
-        load_recent_logs_from_db()
-        load_user_emotions_from_db()
-        
-        # 启动定时任务
-        schedule_cleanup()
+        start_services()
         
         # 注册程序退出时的清理函数
-        atexit.register(cleanup_memory_cache)
+        atexit.register(stop_services)
         
         logger.info("MoodMend後端服務啟動")
         
-        # 在生產環境中，應該使用適當的WSGI服務器
+        # 在生產環境中，應該使用適當的WSGI服務器，或以ASGI模式運行（見 moodmend_asgi.py）
         # 這裡為了演示，使用Flask的開發服務器
         app.run(debug=True, port=5000, host='0.0.0.0')
         
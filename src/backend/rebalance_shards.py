@@ -0,0 +1,217 @@
+# MoodMend 分片数据重新分布工具
+# 在单库和分片之间、或不同分片数之间移动用户数据（日志、日志计数器、每日统计、用户统计汇总、上次情绪、连续打卡、归档），
+# 每个用户的数据按 user_id 的哈希放到对应的分片。
+# 需要在后端服务停止时运行。
+# 运行: python rebalance_shards.py --shards 4                  （单库 moodmend.db 拆分为4个分片）
+#       python rebalance_shards.py --from-shards 4 --shards 8  （4个分片扩展为8个）
+#       python rebalance_shards.py --from-shards 4 --shards 0  （合并回单库）
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from moodmend_backend import (DAILY_STATS_COLUMNS, DB_NAME, archive_path, connect_db, init_archive_db,
+                              migrate_db, shard_index, shard_path)
+
+# 按用户移动的日志列（明确列出，兼容列顺序不同的旧数据库）
+LOG_COLUMNS = ('log_id', 'user_id', 'email', 'time', 'ts', 'day', 'emotion', 'task', 'nft',
+               'completed', 'transition_from', 'transition_to')
+
+def db_paths(shards):
+    return [shard_path(i) for i in range(shards)] if shards else [DB_NAME]
+
+# 按email保存的表（计数器、统计、连续打卡、归档块）由email找到所属用户，再决定目标分片
+EMAIL_OWNER = 'target_shard((SELECT user_id FROM user_keys k WHERE k.email = {alias}.email), {alias}.email)'
+
+# 按用户移动的表: (表名, 列, 所属分片表达式, 主键)；有主键的是计数表，目标库已有同一主键的行时数值累加，
+# 其他表整行覆盖
+MOVED_TABLES = (
+    ('log_counters', ('email', 'emotion', 'period', 'count'), EMAIL_OWNER, ('email', 'emotion', 'period')),
+    ('daily_user_stats', ('email', 'day') + DAILY_STATS_COLUMNS, EMAIL_OWNER, ('email', 'day')),
+    ('user_stats_totals', ('email',) + DAILY_STATS_COLUMNS, EMAIL_OWNER, ('email',)),
+    ('user_emotions', ('user_id', 'last_emotion', 'last_update'), 'target_shard({alias}.user_id, NULL)', None),
+    ('user_streaks', ('email', 'current_streak', 'longest_streak', 'last_day'), EMAIL_OWNER, None),
+)
+
+# 打开数据库并执行未应用的迁移，保证源库和目标库表结构一致，对应的归档库不存在时创建；
+# rebalance_merged 记录从哪个源库累加过哪些用户的计数（见 move_rows）
+def open_db(path):
+    conn = connect_db(path, isolation_level=None)
+    migrate_db(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rebalance_merged (
+            source TEXT NOT NULL,
+            email TEXT NOT NULL,
+            PRIMARY KEY (source, email)
+        )
+    ''')
+    init_archive_db(archive_path(path))
+    return conn
+
+# 在源库连接上建立路由用的临时数据: 目标分片函数、email到user_id的对应关系
+def prepare_source(conn, path, shards):
+    # 与后端路由一致: 有user_id时按user_id，否则按email
+    conn.create_function('target_shard', 2,
+                         lambda user_id, email: shard_index(user_id or email, shards) if shards else 0,
+                         deterministic=True)
+    conn.execute('ATTACH DATABASE ? AS directory', (DB_NAME,))
+    conn.execute('ATTACH DATABASE ? AS source_archive', (archive_path(path),))
+    conn.execute('DROP TABLE IF EXISTS temp.user_keys')
+    # 用用户表、日志和归档块中的 (email, user_id) 找到每个email所属的用户
+    conn.execute('''
+        CREATE TEMP TABLE user_keys AS
+        SELECT email, MAX(user_id) AS user_id FROM (
+            SELECT email, user_id FROM directory.users
+            UNION ALL
+            SELECT DISTINCT email, user_id FROM main.logs WHERE user_id IS NOT NULL
+            UNION ALL
+            SELECT DISTINCT email, user_id FROM source_archive.log_archive WHERE user_id IS NOT NULL
+        ) WHERE email IS NOT NULL GROUP BY email
+    ''')
+    conn.execute('CREATE UNIQUE INDEX temp.idx_user_keys_email ON user_keys (email)')
+    conn.execute('DETACH DATABASE directory')
+
+# 统计源库中每个目标分片的待移动行数
+def count_moves(conn, source, shards):
+    moves = {}
+    queries = {'logs': 'SELECT target_shard(user_id, email), COUNT(*) FROM main.logs GROUP BY 1'}
+    for table, _, owner, _ in MOVED_TABLES:
+        queries[table] = f'SELECT {owner.format(alias="t")}, COUNT(*) FROM main.{table} t GROUP BY 1'
+    queries['log_archive'] = f'SELECT {EMAIL_OWNER.format(alias="t")}, COUNT(*) FROM source_archive.log_archive t GROUP BY 1'
+    for table, query in queries.items():
+        for target, count in conn.execute(query).fetchall():
+            if target != source:
+                moves.setdefault(target, {})[table] = count
+    return moves
+
+# 复制到目标库的计数表行: INSERT OR REPLACE 会覆盖目标库中同一用户已有的计数，改为按主键累加
+def merge_counts_sql(table, columns, owner, key):
+    column_list = ', '.join(columns)
+    updates = ', '.join(f"{col} = {col} + excluded.{col}" for col in columns if col not in key)
+    return f'''
+        INSERT INTO target.{table} ({column_list})
+        SELECT {column_list} FROM main.{table} t
+        WHERE {owner.format(alias="t")} = ?
+          AND t.email NOT IN (SELECT email FROM target.rebalance_merged WHERE source = ?)
+        ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}
+    '''
+
+# 把属于目标分片的数据复制到目标库并提交，再从源库删除；复制和删除时暂停日志的计数器触发器，
+# 计数器、每日统计和用户统计汇总随用户整体移动（包括已归档日志的部分），累加到目标库已有的计数上。
+# 复制时遇到已存在的日志跳过、其他行覆盖；累加过计数的用户记在目标库的 rebalance_merged 表中，
+# 源库删除完成后才清除，中途失败后重新运行不会重复累加，也不会产生重复数据。
+# 从源库删除用户数据时一并删除源库中关于这些用户的记录（同一事务），用户之后再移回来时不会被跳过
+def move_rows(conn, source_path, target_path, target):
+    log_columns = ', '.join(LOG_COLUMNS)
+    counted = [entry for entry in MOVED_TABLES if entry[3]]
+    conn.execute('ATTACH DATABASE ? AS target', (target_path,))
+    conn.execute('ATTACH DATABASE ? AS target_archive', (archive_path(target_path),))
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO target.log_triggers_paused (paused) VALUES (1)')
+            conn.execute(f'''
+                INSERT OR IGNORE INTO target.logs ({log_columns})
+                SELECT {log_columns} FROM main.logs WHERE target_shard(user_id, email) = ?
+            ''', (target,))
+            for table, columns, owner, key in MOVED_TABLES:
+                if key:
+                    conn.execute(merge_counts_sql(table, columns, owner, key), (target, source_path))
+                    continue
+                column_list = ', '.join(columns)
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO target.{table} ({column_list})
+                    SELECT {column_list} FROM main.{table} t WHERE {owner.format(alias="t")} = ?
+                ''', (target,))
+            for table, _, owner, _ in counted:
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO target.rebalance_merged (source, email)
+                    SELECT DISTINCT ?, email FROM main.{table} t WHERE {owner.format(alias="t")} = ?
+                ''', (source_path, target))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO target_archive.log_archive
+                SELECT * FROM source_archive.log_archive t WHERE {EMAIL_OWNER.format(alias="t")} = ?
+            ''', (target,))
+            conn.execute('DELETE FROM target.log_triggers_paused')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO main.log_triggers_paused (paused) VALUES (1)')
+            conn.execute('DELETE FROM main.logs WHERE target_shard(user_id, email) = ?', (target,))
+            for table, _, owner, _ in MOVED_TABLES:
+                conn.execute(f'DELETE FROM main.{table} AS t WHERE {owner.format(alias="t")} = ?', (target,))
+            conn.execute(f'''
+                DELETE FROM source_archive.log_archive AS t WHERE {EMAIL_OWNER.format(alias="t")} = ?
+            ''', (target,))
+            conn.execute(f'DELETE FROM main.rebalance_merged AS t WHERE {EMAIL_OWNER.format(alias="t")} = ?',
+                         (target,))
+            conn.execute('DELETE FROM main.log_triggers_paused')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        # 源库中已没有这些用户的数据，之后再移动到该目标库时重新累加
+        conn.execute('DELETE FROM target.rebalance_merged WHERE source = ?', (source_path,))
+    finally:
+        conn.execute('DETACH DATABASE target_archive')
+        conn.execute('DETACH DATABASE target')
+
+def rebalance(from_shards, to_shards, dry_run=False):
+    sources = db_paths(from_shards)
+    targets = db_paths(to_shards)
+    moved = 0
+    for source_path in sources:
+        if not os.path.exists(source_path):
+            print(f"跳过不存在的源库: {source_path}")
+            continue
+        conn = open_db(source_path)
+        try:
+            prepare_source(conn, source_path, to_shards)
+            # 源库本身也是目标分片之一时，属于该分片的数据留在原处
+            source = targets.index(source_path) if source_path in targets else -1
+            for target, counts in sorted(count_moves(conn, source, to_shards).items()):
+                summary = ', '.join(f"{table}={count}" for table, count in counts.items())
+                print(f"{source_path} -> {targets[target]}: {summary}")
+                moved += sum(counts.values())
+                if not dry_run:
+                    open_db(targets[target]).close()
+                    move_rows(conn, source_path, targets[target], target)
+        finally:
+            conn.close()
+    return moved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按用户在分片之间重新分布数据')
+    parser.add_argument('--shards', type=int, required=True, help='目标分片数，0表示单库')
+    parser.add_argument('--from-shards', type=int, default=0, help='当前分片数，0表示单库（默认）')
+    parser.add_argument('--dry-run', action='store_true', help='只统计需要移动的行数，不修改数据')
+    args = parser.parse_args(argv)
+
+    if args.shards < 0 or args.from_shards < 0:
+        print('分片数不能为负数')
+        return 2
+    if args.shards == args.from_shards:
+        print('分片数没有变化')
+        return 0
+
+    try:
+        moved = rebalance(args.from_shards, args.shards, args.dry_run)
+    except sqlite3.Error as e:
+        print(f"重新分布失败: {e}")
+        return 1
+    print(f"{'需要移动' if args.dry_run else '已移动'} {moved} 行")
+    if args.shards:
+        print(f"启动后端前请设置 MOODMEND_DB_SHARDS={args.shards}")
+    if args.from_shards > args.shards:
+        unused = [shard_path(i) for i in range(args.shards, args.from_shards)]
+        print(f"以下分片已不再使用，确认后可删除: {', '.join(unused)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+# 测试共用的运行环境: 导入后端之前设置环境变量，数据库、日志和密钥文件都写在临时目录中
+# （后端按当前目录的相对路径打开数据库，整个测试会话共用一个数据库，各测试使用不同的邮箱）
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'backend'))
+
+# 情绪分类在请求线程中执行（测试中不启动进程池），签名密钥固定
+os.environ.setdefault('MOODMEND_CLASSIFY_WORKERS', '0')
+os.environ.setdefault('MOODMEND_TOKEN_SECRET', 'moodmend-test-secret')
+
+WORK_DIR = tempfile.mkdtemp(prefix='moodmend-test-')
+os.chdir(WORK_DIR)
+
+@pytest.fixture(scope='session')
+def backend():
+    import moodmend_backend
+    moodmend_backend.init_db()
+    yield moodmend_backend
+    moodmend_backend.stop_services()
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+# 每个测试使用不同的邮箱，互不影响
+@pytest.fixture
+def email(request):
+    return f"{request.node.name.replace('[', '-').replace(']', '')}@test.example".lower()
+
+# 注册一个用户，返回带令牌的请求头
+@pytest.fixture
+def auth(client, email):
+    response = client.post('/api/register', json={'email': email, 'password': 'secret1',
+                                                  'confirm_password': 'secret1', 'user_name': '測試'})
+    assert response.status_code == 201
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
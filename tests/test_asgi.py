@@ -0,0 +1,134 @@
+# ASGI 模式与 WSGI 模式执行同一套处理函数: 同样的请求序列分别经过 app.test_client() 和 AsgiApp，
+# 状态码和响应体必须一致（两次请求使用不同的邮箱，比较前替换邮箱和每次不同的字段）
+
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from moodmend_asgi import AsgiApp
+
+# 每次请求都不同的字段: 用户ID、令牌、日志ID、时间和游标
+VOLATILE_KEYS = ('user_id', 'token', 'log_id', 'time', 'next_cursor')
+
+DIARY = ('今天早上很焦慮，' + '平常的一天。' * 600 + '晚上和朋友聊天之後很開心').encode('utf-8')
+
+# 用一个新的事件循环执行一次ASGI请求，请求体按chunk字节分块发送
+def asgi_request(app, method, path, query='', headers=(), body=b'', chunk=1000):
+    async def run():
+        messages = [{'type': 'http.request', 'body': body[i:i + chunk], 'more_body': i + chunk < len(body)}
+                    for i in range(0, len(body), chunk)] or [{'type': 'http.request', 'body': b''}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http',
+            'path': path, 'root_path': '', 'query_string': query.encode('latin-1'),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+            'server': ('localhost', 5000), 'client': ('127.0.0.1', 50000),
+        }
+        await app(scope, receive, send)
+        start = next(m for m in sent if m['type'] == 'http.response.start')
+        return start['status'], b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+
+    return asyncio.run(run())
+
+def normalize(body, email):
+    body = body.replace(email.encode('utf-8'), b'<email>')
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: '<volatile>' if k in VOLATILE_KEYS else strip(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+    return strip(data)
+
+def normalize_export(body, email, compressed=False):
+    if compressed:
+        body = gzip.decompress(body)
+    lines = body.replace(email.encode('utf-8'), b'<email>').splitlines()
+    if lines and lines[0].startswith(b'{'):
+        return [normalize(line, email) for line in lines]
+    # CSV: 去掉每行的log_id和时间列以外的内容保持不变
+    return [line.split(b',')[2:] for line in lines]
+
+# 同一个请求序列，send(method, path, query, headers, body) 返回 (状态码, 响应体)
+def run_scenario(send, email):
+    results = []
+    json_headers = [('Content-Type', 'application/json')]
+    status, body = send('POST', '/api/register', '', json_headers, json.dumps({
+        'email': email, 'password': 'secret1', 'confirm_password': 'secret1', 'user_name': '測試'
+    }).encode('utf-8'))
+    results.append((status, normalize(body, email)))
+    auth = [('Authorization', f"Bearer {json.loads(body)['token']}")]
+
+    status, body = send('POST', '/api/process-emotion', '', json_headers + auth,
+                        json.dumps({'input': '今天很難過', 'email': email}).encode('utf-8'))
+    results.append((status, normalize(body, email)))
+    status, body = send('POST', '/api/process-emotion', f'email={email}',
+                        [('Content-Type', 'text/plain; charset=utf-8')] + auth, DIARY)
+    results.append((status, normalize(body, email)))
+
+    for emotion in ('sad', 'happy'):
+        status, body = send('POST', '/api/add-log', '', json_headers + auth, json.dumps({
+            'email': email, 'emotion': emotion, 'task': '散步', 'nft': '🌿 平靜徽章', 'completed': True
+        }).encode('utf-8'))
+        results.append((status, normalize(body, email)))
+
+    for query in (f'email={email}', f'email={email}&emotion=sad', f'email={email}&limit=1'):
+        status, body = send('GET', '/api/get-logs', query, auth, b'')
+        results.append((status, normalize(body, email)))
+    status, body = send('GET', '/api/get-stats', f'email={email}', auth, b'')
+    results.append((status, normalize(body, email)))
+
+    for query, compressed in (('format=ndjson', False), ('format=csv', False), ('format=ndjson&gzip=1', True)):
+        status, body = send('GET', '/api/export-logs', f'email={email}&{query}', auth, b'')
+        results.append((status, normalize_export(body, email, compressed)))
+    return results
+
+def test_asgi_matches_wsgi(backend, client, email):
+    def send_wsgi(method, path, query, headers, body):
+        response = client.open(path, method=method, query_string=query, headers=headers, data=body)
+        return response.status_code, response.get_data()
+
+    # 缓冲区小于日记请求体，text/plain请求会边接收边由处理线程读取
+    app = AsgiApp(backend.app, threads=4, buffer_bytes=4096)
+
+    def send_asgi(method, path, query, headers, body):
+        return asgi_request(app, method, path, query, headers, body)
+
+    wsgi_results = run_scenario(send_wsgi, 'wsgi-' + email)
+    asgi_results = run_scenario(send_asgi, 'asgi-' + email)
+    assert [status for status, _ in wsgi_results][:3] == [201, 200, 200]
+    assert wsgi_results[5][1]['total'] == 2
+    assert len(wsgi_results[-1][1]) == 2
+    assert asgi_results == wsgi_results
+
+def test_asgi_rejects_large_body(backend):
+    app = AsgiApp(backend.app, threads=2, max_body=1024, buffer_bytes=256)
+    # 带Content-Length时直接返回413，不读取请求体
+    status, _ = asgi_request(app, 'POST', '/api/process-emotion', 'email=x@test.example',
+                             [('Content-Type', 'text/plain'), ('Content-Length', '4096')], b'x' * 4096)
+    assert status == 413
+
+@pytest.mark.parametrize('size', [10, 5000])
+def test_asgi_body_without_content_length(backend, email, size):
+    app = AsgiApp(backend.app, threads=2, buffer_bytes=1024)
+    body = ('開心' * size).encode('utf-8')
+    status, response = asgi_request(app, 'POST', '/api/process-emotion', f'email={email}',
+                                    [('Content-Type', 'text/plain; charset=utf-8')], body, chunk=700)
+    assert status == 200
+    assert json.loads(response)['chars_scanned'] == min(2 * size, backend.MAX_EMOTION_SCAN_CHARS)
@@ -0,0 +1,54 @@
+# bulk_rescore 的批量评分必须与逐条调用 detect_emotion 的结果完全一致
+# 运行: python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'backend'))
+
+import pytest  # noqa: E402
+
+np = pytest.importorskip('numpy')
+
+from bench_emotion import build_corpora  # noqa: E402
+from bulk_rescore import KeywordScorer  # noqa: E402
+from moodmend_backend import MAX_EMOTION_SCAN_CHARS, detect_emotion, get_lexicon  # noqa: E402
+
+# 语料之外的边界情况: 空文本、非字符串、只有否定词或中性表达、大小写、超过扫描上限的长文本
+EDGE_CASES = ['', None, 123, '   ', '不', '還好', '沒什麼特別的', 'HAPPY today', 'Sad and ANGRY',
+              '今天' * 20, '開心' + '。' * MAX_EMOTION_SCAN_CHARS + '難過']
+
+def corpus():
+    texts = [text for texts in build_corpora(7).values() for text in texts]
+    lexicon = get_lexicon()
+    texts += [kw for keyword_list in lexicon.emotion_keywords.values() for kw, _ in keyword_list]
+    texts += lexicon.negations + lexicon.neutral_phrases
+    return texts + EDGE_CASES
+
+def test_parity_with_detect_emotion():
+    texts = corpus()
+    labels = KeywordScorer(get_lexicon().emotion_keywords).score(texts)
+    assert labels.tolist() == [detect_emotion(t) for t in texts]
+
+# 很小的批大小上限下，分批和按长度排序后结果仍按输入顺序返回
+def test_small_batches_keep_order():
+    texts = corpus()
+    scorer = KeywordScorer(get_lexicon().emotion_keywords)
+    expected = scorer.score(texts).tolist()
+    assert scorer.score(texts, batch_size=7, batch_chars=500).tolist() == expected
+
+# 每批的 条数×最长长度 不超过上限，超长文本单独一批
+def test_batches_bounded_by_chars():
+    texts = ['短文本'] * 1000 + ['長' * 8000]
+    scorer = KeywordScorer(get_lexicon().emotion_keywords)
+    widths = []
+    score_batch = scorer._score_batch
+
+    def record(batch):
+        widths.append((len(batch), max(len(t) for t in batch)))
+        return score_batch(batch)
+
+    scorer._score_batch = record
+    scorer.score(texts, batch_chars=1000)
+    assert all(count * longest <= 1000 or count == 1 for count, longest in widths)
+    assert sum(count for count, _ in widths) == len(texts)
@@ -0,0 +1,44 @@
+# 导出日志: 空用户的CSV也有表头，读取中途失败时客户端能判断导出不完整
+
+import gzip
+import json
+
+import pytest
+
+def add_log(client, auth, email, emotion):
+    response = client.post('/api/add-log', headers=auth, json={'email': email, 'emotion': emotion, 'task': '散步',
+                                                'nft': '🌿 平靜徽章', 'completed': True})
+    assert response.status_code == 200
+
+def test_empty_csv_has_header(backend, client, email):
+    response = client.get('/api/export-logs', query_string={'email': email, 'format': 'csv'})
+    assert response.status_code == 200
+    assert response.get_data().decode('utf-8') == '﻿' + ','.join(backend.EXPORT_COLUMNS) + '\r\n'
+    assert gzip.decompress(client.get('/api/export-logs', query_string={
+        'email': email, 'format': 'csv', 'gzip': '1'}).get_data()).startswith('﻿log_id'.encode('utf-8'))
+
+def test_csv_and_ndjson_rows(backend, client, email, auth):
+    for emotion in ('sad', 'happy'):
+        add_log(client, auth, email, emotion)
+    lines = client.get('/api/export-logs', query_string={'email': email, 'format': 'csv'}).get_data().decode('utf-8').splitlines()
+    assert len(lines) == 3 and lines[0] == '﻿' + ','.join(backend.EXPORT_COLUMNS)
+    records = [json.loads(line) for line in client.get('/api/export-logs', query_string={'email': email}).get_data().splitlines()]
+    assert [r['emotion'] for r in records] == ['sad', 'happy']
+
+# 读取到第一条日志之后出错
+@pytest.fixture
+def failing_logs(backend, monkeypatch):
+    def iter_user_logs(email, shard=None):
+        yield ('id-1', '2026-10-01T08:00:00', 'sad', '散步', '', 1, None, None)
+        raise RuntimeError('disk I/O error')
+    monkeypatch.setattr(backend, 'iter_user_logs', iter_user_logs)
+
+def test_ndjson_failure_ends_with_error_record(backend, client, email, failing_logs):
+    lines = client.get('/api/export-logs', query_string={'email': email}).get_data().splitlines()
+    last = json.loads(lines[-1])
+    assert last['success'] is False and 'log_id' not in last
+
+@pytest.mark.parametrize('query', [{'format': 'csv'}, {'format': 'ndjson', 'gzip': '1'}])
+def test_csv_and_gzip_failure_abort_the_stream(client, email, failing_logs, query):
+    with pytest.raises(RuntimeError):
+        client.get('/api/export-logs', query_string={'email': email, **query}).get_data()
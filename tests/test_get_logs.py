@@ -0,0 +1,96 @@
+# get-logs 分页: 游标翻页和offset翻页的结果一致并覆盖已归档的日志，同一秒内的日志按写入顺序排列，
+# 各种过滤条件下返回的总数与实际翻到的条数一致；只有需要读取归档时才取得归档库连接
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+EMOTIONS = ('sad', 'happy', 'anxious')
+
+# 直接写入日志: 每条日志的time比上一条晚1微秒，多条日志落在同一秒内；返回按写入顺序的log_id
+def insert_logs(backend, email, user_id, start, count, per_second=5):
+    conn = backend.connect_db(backend.DB_NAME, isolation_level=None)
+    log_ids = []
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for i in range(count):
+            moment = start + timedelta(seconds=i // per_second, microseconds=i % per_second + 1)
+            log_id = str(uuid.uuid4())
+            backend.write_log(conn.cursor(), (
+                log_id, user_id, email, moment.isoformat(), int(moment.timestamp()), moment.date().isoformat(),
+                EMOTIONS[i % len(EMOTIONS)], '散步', '🌿 平靜徽章', i % 2, None, None))
+            log_ids.append(log_id)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return log_ids
+
+def user_id_of(backend, email):
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        return conn.execute('SELECT user_id FROM users WHERE email = ?', (email,)).fetchone()[0]
+    finally:
+        conn.close()
+
+# 用游标或offset翻完所有页，返回 (log_id列表, 每页的总数)
+def walk(client, auth, query, use_cursor, limit=7):
+    log_ids, totals = [], set()
+    page_cursor, offset = None, 0
+    while True:
+        params = {**query, 'limit': limit}
+        if use_cursor and page_cursor:
+            params['cursor'] = page_cursor
+        elif not use_cursor:
+            params['offset'] = offset
+        data = client.get('/api/get-logs', query_string=params, headers=auth).get_json()
+        assert data['success'], data
+        log_ids += [log['log_id'] for log in data['logs']]
+        totals.add(data['total'])
+        offset += limit
+        page_cursor = data['next_cursor']
+        if len(data['logs']) < limit or (use_cursor and not page_cursor):
+            return log_ids, totals
+
+@pytest.fixture
+def archived_user(backend, email, auth):
+    user_id = user_id_of(backend, email)
+    now = datetime.now().replace(microsecond=0)
+    old = insert_logs(backend, email, user_id, now - timedelta(days=100), 23)
+    recent = insert_logs(backend, email, user_id, now - timedelta(days=2), 18)
+    cutoff = int((now - timedelta(days=50)).timestamp())
+    assert backend.archive_logs(backend.DB_NAME, cutoff) >= len(old)
+    return email, auth, old + recent
+
+def test_same_second_logs_keep_insertion_order(client, archived_user):
+    email, auth, log_ids = archived_user
+    newest_first = list(reversed(log_ids))
+    assert walk(client, auth, {'email': email}, use_cursor=True) == (newest_first, {len(log_ids)})
+    assert walk(client, auth, {'email': email}, use_cursor=False) == (newest_first, {len(log_ids)})
+
+@pytest.mark.parametrize('query', [{'emotion': 'sad'}, {'date': '20'}, {'emotion': 'happy', 'date': '2'}])
+def test_cursor_and_offset_agree_across_archive(client, archived_user, query):
+    email, auth, _ = archived_user
+    by_cursor, cursor_totals = walk(client, auth, {'email': email, **query}, use_cursor=True)
+    by_offset, offset_totals = walk(client, auth, {'email': email, **query}, use_cursor=False, limit=4)
+    assert by_cursor == by_offset
+    assert cursor_totals == offset_totals == {len(by_cursor)}
+
+def test_invalid_cursor_is_rejected(client, email, auth):
+    response = client.get('/api/get-logs', query_string={'email': email, 'cursor': 'not-a-cursor'}, headers=auth)
+    assert response.status_code == 400
+
+# 本页由日志表填满、总数来自计数器时不取得归档库连接；翻到归档部分时才取得
+def test_archive_connection_acquired_only_when_needed(backend, client, archived_user, monkeypatch):
+    email, auth, _ = archived_user
+    acquired = []
+    get_archive_db = backend.get_archive_db
+    monkeypatch.setattr(backend, 'get_archive_db', lambda identity: acquired.append(1) or get_archive_db(identity))
+
+    data = client.get('/api/get-logs', query_string={'email': email, 'limit': 5}, headers=auth).get_json()
+    assert len(data['logs']) == 5 and data['total'] == 41
+    assert acquired == []
+
+    data = client.get('/api/get-logs', query_string={'email': email, 'limit': 5, 'offset': 20}, headers=auth).get_json()
+    assert len(data['logs']) == 5
+    assert acquired
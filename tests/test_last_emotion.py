@@ -0,0 +1,59 @@
+# 上次情绪交给写入队列、不等待提交: 提交完成之前的下一个请求也要读到刚写入的情绪（同一进程内读己之写），
+# 提交完成后以数据库中的值为准
+
+import threading
+
+import pytest
+
+@pytest.fixture
+def held_writes(backend, monkeypatch):
+    release = threading.Event()
+    write_last_emotion = backend.write_last_emotion
+
+    # 写线程执行到保存上次情绪时等待，模拟提交还没有完成
+    def delayed(cursor, *args):
+        assert release.wait(10)
+        write_last_emotion(cursor, *args)
+
+    monkeypatch.setattr(backend, 'write_last_emotion', delayed)
+    yield release
+    release.set()
+
+def stored_last_emotion(backend, email):
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        row = conn.execute('''
+            SELECT ue.last_emotion FROM users u JOIN user_emotions ue ON ue.user_id = u.user_id WHERE u.email = ?
+        ''', (email,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def user_id_of(backend, email):
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        return conn.execute('SELECT user_id FROM users WHERE email = ?', (email,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def process(client, auth, email, text):
+    response = client.post('/api/process-emotion', headers=auth,
+                           json={'input': text, 'email': email, 'task_completed': True})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_last_emotion_read_your_writes(backend, client, email, auth, held_writes):
+    assert process(client, auth, email, '今天很焦慮')['emotion'] == 'anxious'
+    assert stored_last_emotion(backend, email) is None
+
+    # 上一次的写入还没有提交，转移仍按刚才的焦虑计算
+    result = process(client, auth, email, '今天很開心')
+    assert result['emotion'] == 'happy'
+    assert result['transition'] == {'from': 'anxious', 'to': 'happy'}
+
+    with backend.pending_last_emotions_lock:
+        emotion, future = backend.pending_last_emotions[user_id_of(backend, email)]
+    assert emotion == 'happy'
+    held_writes.set()
+    future.result(timeout=10)
+    assert stored_last_emotion(backend, email) == 'happy'
@@ -0,0 +1,111 @@
+# 分片重新分布: 计数器、每日统计和用户统计汇总随用户移动后与实际日志（日志表加归档块）逐条统计的结果一致；
+# 目标库已有同一用户的数据时计数累加而不是覆盖，中途失败后重新运行也不会重复累加
+
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import rebalance_shards
+
+EMAILS = [f'user{i}@rebalance.example' for i in range(8)]
+
+@pytest.fixture
+def workdir(backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conn = rebalance_shards.open_db(backend.DB_NAME)
+    try:
+        for i, email in enumerate(EMAILS):
+            conn.execute('INSERT INTO users (user_id, email, password, user_name) VALUES (?, ?, ?, ?)',
+                         (f'u{i}', email, 'x', '測試'))
+    finally:
+        conn.close()
+    return tmp_path
+
+def user_id(email):
+    return f'u{EMAILS.index(email)}'
+
+def insert_logs(backend, path, email, start, count):
+    conn = rebalance_shards.open_db(path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for i in range(count):
+            moment = start + timedelta(hours=i * 5)
+            backend.write_log(conn.cursor(), (
+                str(uuid.uuid4()), user_id(email), email, moment.isoformat(), int(moment.timestamp()),
+                moment.date().isoformat(), ('sad', 'happy', 'angry')[i % 3], '散步', '🌿 平靜徽章', i % 2,
+                None, 'happy' if i % 4 == 0 else None))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+# 每个库中每个用户的 (计数器总数, 日汇总总数, 用户汇总总数, 完成数) 与实际日志数比较
+def check_counts(backend, paths):
+    found = set()
+    for path in paths:
+        conn = backend.connect_db(path)
+        archive = backend.connect_db(backend.archive_path(path))
+        try:
+            emails = {row[0] for row in conn.execute('SELECT email FROM log_counters')}
+            for email in emails:
+                logs = conn.execute('SELECT completed FROM logs WHERE email = ?', (email,)).fetchall()
+                completed_i = backend.ARCHIVE_COLUMNS.index('completed')
+                logs += [(row[completed_i],) for row in backend.iter_archived_logs(archive.cursor(), email)]
+                expected = (len(logs), len(logs), len(logs), sum(1 for row in logs if row[0]))
+                assert conn.execute('''
+                    SELECT (SELECT count FROM log_counters WHERE email = ? AND emotion = '' AND period = ''),
+                           (SELECT SUM(total) FROM daily_user_stats WHERE email = ?),
+                           (SELECT total FROM user_stats_totals WHERE email = ?),
+                           (SELECT completed FROM user_stats_totals WHERE email = ?)
+                ''', (email, email, email, email)).fetchone() == expected, (path, email)
+            assert not found & emails
+            found |= emails
+        finally:
+            archive.close()
+            conn.close()
+    return found
+
+def test_rebalance_keeps_counts(backend, workdir):
+    now = datetime.now().replace(microsecond=0)
+    for email in EMAILS:
+        insert_logs(backend, backend.DB_NAME, email, now - timedelta(days=90), 12)
+        insert_logs(backend, backend.DB_NAME, email, now - timedelta(days=5), 6)
+    backend.archive_logs(backend.DB_NAME, int((now - timedelta(days=40)).timestamp()))
+    # 部分用户在目标分片中已有日志，移动后计数应累加
+    for email in EMAILS[:4]:
+        shard = backend.shard_path(backend.shard_index(user_id(email), 2))
+        insert_logs(backend, shard, email, now - timedelta(days=1), 3)
+
+    rebalance_shards.rebalance(0, 2)
+    shards = [backend.shard_path(i) for i in range(2)]
+    assert check_counts(backend, shards) == set(EMAILS)
+
+    rebalance_shards.rebalance(2, 0)
+    assert check_counts(backend, [backend.DB_NAME]) == set(EMAILS)
+
+def test_rebalance_rerun_after_failed_delete(backend, workdir):
+    now = datetime.now().replace(microsecond=0)
+    for email in EMAILS:
+        insert_logs(backend, backend.DB_NAME, email, now - timedelta(days=3), 5)
+        shard = backend.shard_path(backend.shard_index(user_id(email), 2))
+        insert_logs(backend, shard, email, now - timedelta(days=1), 2)
+
+    # 复制到目标库已提交、从源库删除时失败
+    conn = sqlite3.connect(backend.DB_NAME)
+    conn.execute("CREATE TRIGGER fail_delete BEFORE DELETE ON logs BEGIN SELECT RAISE(ABORT, 'boom'); END")
+    conn.close()
+    with pytest.raises(sqlite3.Error):
+        rebalance_shards.rebalance(0, 2)
+    conn = sqlite3.connect(backend.DB_NAME)
+    conn.execute('DROP TRIGGER fail_delete')
+    conn.close()
+
+    rebalance_shards.rebalance(0, 2)
+    assert check_counts(backend, [backend.shard_path(i) for i in range(2)]) == set(EMAILS)
+    for path in [backend.DB_NAME] + [backend.shard_path(i) for i in range(2)]:
+        conn = sqlite3.connect(path)
+        try:
+            assert conn.execute('SELECT COUNT(*) FROM rebalance_merged').fetchone()[0] == 0
+        finally:
+            conn.close()
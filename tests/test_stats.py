@@ -0,0 +1,101 @@
+# 统计汇总与逐条统计一致: 日志计数器、每日统计和用户统计汇总在记录日志、归档之后
+# 仍与实际日志（日志表加归档块）逐条统计的结果相同
+
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+EMOTIONS = ('sad', 'happy', 'anxious', 'neutral')
+
+def insert_logs(backend, email, user_id, start, count):
+    conn = backend.connect_db(backend.DB_NAME, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for i in range(count):
+            moment = start + timedelta(hours=i * 7)
+            transition = ('sad', 'happy') if i % 5 == 0 else (None, None)
+            backend.write_log(conn.cursor(), (
+                str(uuid.uuid4()), user_id, email, moment.isoformat(), int(moment.timestamp()),
+                moment.date().isoformat(), EMOTIONS[i % len(EMOTIONS)], '散步', '🌿 平靜徽章', i % 3 == 0,
+                *transition))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+# 日志表和归档块中该用户的全部日志: [(emotion, day, completed, transition_to)]
+def all_logs(backend, email):
+    conn = backend.connect_db(backend.DB_NAME)
+    archive = backend.connect_db(backend.archive_path(backend.DB_NAME))
+    try:
+        rows = conn.execute('SELECT emotion, day, completed, transition_to FROM logs WHERE email = ?',
+                            (email,)).fetchall()
+        columns = [backend.ARCHIVE_COLUMNS.index(c) for c in ('emotion', 'day', 'completed', 'transition_to')]
+        rows += [tuple(log[i] for i in columns) for log in backend.iter_archived_logs(archive.cursor(), email)]
+        return rows
+    finally:
+        archive.close()
+        conn.close()
+
+def expected_stats(rows):
+    emotions = Counter(row[0] for row in rows)
+    stats = {'total': len(rows), 'completed': sum(1 for row in rows if row[2]),
+             'transitions': sum(1 for row in rows if row[3] is not None)}
+    stats.update({emotion: emotions[emotion] for emotion in ('anxious', 'sad', 'neutral', 'happy', 'angry')})
+    return stats
+
+def check_stats(backend, client, auth, email):
+    rows = all_logs(backend, email)
+    expected = expected_stats(rows)
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        cursor = conn.cursor()
+        assert backend.load_period_stats(cursor, email) == expected
+        daily = conn.execute('SELECT SUM(total), SUM(completed) FROM daily_user_stats WHERE email = ?',
+                             (email,)).fetchone()
+        assert daily == (expected['total'], expected['completed'])
+        counters = dict(conn.execute("SELECT emotion, count FROM log_counters WHERE email = ? AND period = ''",
+                                     (email,)).fetchall())
+        assert counters == {'': len(rows), **{e: n for e, n in Counter(row[0] for row in rows).items()}}
+        months = Counter(row[1][:7] for row in rows)
+        assert dict(conn.execute("""
+            SELECT period, count FROM log_counters WHERE email = ? AND emotion = '' AND length(period) = 7
+        """, (email,)).fetchall()) == months
+    finally:
+        conn.close()
+
+    data = client.get('/api/get-stats', query_string={'email': email, 'period': 'all'}, headers=auth).get_json()
+    assert data['total_logs'] == expected['total']
+    assert data['transitions'] == expected['transitions']
+    assert data['chart_data'] == {e: expected[e] for e in data['chart_data']}
+
+@pytest.fixture
+def user_with_logs(backend, client, email, auth):
+    conn = backend.connect_db(backend.DB_NAME)
+    user_id = conn.execute('SELECT user_id FROM users WHERE email = ?', (email,)).fetchone()[0]
+    conn.close()
+    now = datetime.now().replace(microsecond=0)
+    insert_logs(backend, email, user_id, now - timedelta(days=120), 40)
+    insert_logs(backend, email, user_id, now - timedelta(days=3), 6)
+    for emotion in ('sad', 'happy'):
+        response = client.post('/api/add-log', headers=auth, json={
+            'email': email, 'emotion': emotion, 'task': '散步', 'nft': '🌿 平靜徽章', 'completed': True})
+        assert response.status_code == 200
+    return email, auth
+
+def test_stats_match_logs_after_add(backend, client, user_with_logs):
+    email, auth = user_with_logs
+    assert len(all_logs(backend, email)) == 48
+    check_stats(backend, client, auth, email)
+
+def test_stats_match_logs_after_archive(backend, client, user_with_logs):
+    email, auth = user_with_logs
+    cutoff = int((datetime.now() - timedelta(days=30)).timestamp())
+    assert backend.archive_logs(backend.DB_NAME, cutoff) >= 40
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM logs WHERE email = ?', (email,)).fetchone()[0] == 8
+    finally:
+        conn.close()
+    check_stats(backend, client, auth, email)
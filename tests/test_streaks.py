@@ -0,0 +1,79 @@
+# 连续打卡和日志日期按用户时区计算: 同一时刻不同时区的用户可能已经是第二天，
+# 日志的day、每日统计和连续打卡必须使用同一个日期
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# 冻结后端看到的当前时间（UTC时刻），now() 不带时区时返回服务器本地时间
+@pytest.fixture
+def clock(backend, monkeypatch):
+    state = {'now': datetime(2026, 3, 1, 15, 30, tzinfo=timezone.utc)}
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            moment = state['now'].astimezone(tz)
+            return moment if tz else moment.replace(tzinfo=None)
+
+    monkeypatch.setattr(backend, 'datetime', FrozenDatetime)
+    return state
+
+def register(client, email, tz):
+    response = client.post('/api/register', json={'email': email, 'password': 'secret1', 'confirm_password': 'secret1',
+                                                  'user_name': '測試', 'timezone': tz})
+    assert response.status_code == 201
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def complete_task(client, auth, email):
+    response = client.post('/api/add-log', headers=auth, json={
+        'email': email, 'emotion': 'happy', 'task': '散步', 'nft': '🌿 平靜徽章', 'completed': True})
+    assert response.status_code == 200
+
+def stats(client, auth, email, period='all'):
+    return client.get('/api/get-stats', query_string={'email': email, 'period': period}, headers=auth).get_json()
+
+def log_days(backend, email):
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        return [row[0] for row in conn.execute('SELECT day FROM logs WHERE email = ? ORDER BY rowid', (email,))]
+    finally:
+        conn.close()
+
+def test_streak_rolls_over_at_user_midnight(backend, client, clock, email):
+    taipei, los_angeles = 'taipei-' + email, 'la-' + email
+    auth = {taipei: register(client, taipei, 'Asia/Taipei'),
+            los_angeles: register(client, los_angeles, 'America/Los_Angeles')}
+
+    # 台北 23:30 / 洛杉矶 07:30，一小时后台北已经是第二天，洛杉矶还是同一天
+    for user in (taipei, los_angeles):
+        complete_task(client, auth[user], user)
+    clock['now'] += timedelta(hours=1)
+    for user in (taipei, los_angeles):
+        complete_task(client, auth[user], user)
+
+    assert log_days(backend, taipei) == ['2026-03-01', '2026-03-02']
+    assert log_days(backend, los_angeles) == ['2026-03-01', '2026-03-01']
+    assert (stats(client, auth[taipei], taipei)['streak'], stats(client, auth[taipei], taipei)['longest_streak']) == (2, 2)
+    assert stats(client, auth[los_angeles], los_angeles)['streak'] == 1
+
+    # 每日统计与日志使用同一天: 台北用户当天只有一条，按日期过滤也只有一条
+    conn = backend.connect_db(backend.DB_NAME)
+    try:
+        assert conn.execute('SELECT day, total FROM daily_user_stats WHERE email = ? ORDER BY day',
+                            (taipei,)).fetchall() == [('2026-03-01', 1), ('2026-03-02', 1)]
+    finally:
+        conn.close()
+    logs = client.get('/api/get-logs', query_string={'email': taipei, 'date': '2026-03-02'},
+                      headers=auth[taipei]).get_json()
+    assert logs['total'] == 1
+
+    # 一周内的统计从用户时区的7天前算起，两条都在范围内
+    assert stats(client, auth[taipei], taipei, 'week')['total_logs'] == 2
+
+    # 错过一天（用户时区）之后当前连续天数归零，最长连续天数保留
+    clock['now'] += timedelta(days=2)
+    data = stats(client, auth[taipei], taipei)
+    assert (data['streak'], data['longest_streak']) == (0, 2)
+    complete_task(client, auth[taipei], taipei)
+    assert stats(client, auth[taipei], taipei)['streak'] == 1